@@ -0,0 +1,242 @@
+'''
+Extracts a deployment zip into one or more destinations in a single pass.
+
+Every member is decompressed once, by a pool of threads, and written to all destinations
+at the same time. There is no temporary copy and no robocopy. Each member goes to a
+.tmp file next to its target, which replaces the target only once the member's CRC-32
+has been verified. A destination that fails (locked file, full disk) does not stop the
+others. Progress and the per-destination results are printed, or emitted as JSON lines
+with --json, and can also be written to a JSON report.
+
+Usage: python extract.py "path\\to\\file.zip" "destination1" ["destination2" ...] [--workers N] [--json] [--report result.json]
+Only the standard library is used, so the script can be copied to the server on its own.
+'''
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+import zlib
+from pathlib import Path, PurePosixPath
+from typing import Dict, List
+
+CHUNK_SIZE = 1024 * 1024
+BATCH_FILES = 64
+BATCH_BYTES = 64 * 1024 * 1024
+PROGRESS_INTERVAL_SECONDS = 2
+
+
+class DestinationResult:
+    def __init__(self, path: Path):
+        self.path = path
+        self.files = 0
+        self.bytes = 0
+        self.errors: Dict[str, str] = {} # Member -> error
+
+    def to_dict(self) -> Dict:
+        return {
+            "destination": str(self.path),
+            "status": "failed" if self.errors else "success",
+            "files": self.files,
+            "bytes": self.bytes,
+            "errors": self.errors,
+        }
+
+
+class Extractor:
+    def __init__(self, zip_path: Path, destinations: List[Path], workers: int, json_output: bool=False):
+        self.zip_path = zip_path
+        self.results = [DestinationResult(destination) for destination in destinations]
+        self.workers = max(1, workers)
+        self.json_output = json_output
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.crc_errors: List[str] = []
+
+    def emit(self, event: str, message: str, **fields):
+        if self.json_output:
+            print(json.dumps({"event": event, **fields}), flush=True)
+        else:
+            print(message, flush=True)
+
+    def archive(self) -> zipfile.ZipFile:
+        if not hasattr(self.local, "archive"):
+            self.local.archive = zipfile.ZipFile(self.zip_path) # One handle per thread, reads are not thread-safe
+        return self.local.archive
+
+    def extract_member(self, info: zipfile.ZipInfo):
+        '''Decompress one member into every destination, replacing the targets only if its CRC is valid.'''
+        targets = {}
+        for result in self.results:
+            target = result.path / info.filename
+            try:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = target.with_name(f"{target.name}.{threading.get_ident()}.tmp")
+                targets[result.path] = (result, target, tmp_path, open(tmp_path, 'wb'))
+            except OSError as e:
+                self.fail(result, info.filename, e)
+
+        try:
+            # ZipExtFile checks the CRC-32 once the member has been read to the end
+            with self.archive().open(info) as src:
+                while chunk := src.read(CHUNK_SIZE):
+                    for key, (result, target, tmp_path, dst) in list(targets.items()):
+                        try:
+                            dst.write(chunk)
+                        except OSError as e:
+                            dst.close()
+                            tmp_path.unlink(missing_ok=True)
+                            del targets[key]
+                            self.fail(result, info.filename, e)
+        except (zipfile.BadZipFile, zlib.error, OSError, EOFError) as e:
+            for result, target, tmp_path, dst in targets.values():
+                dst.close()
+                tmp_path.unlink(missing_ok=True)
+            for result in self.results:
+                self.fail(result, info.filename, e)
+            with self.lock:
+                self.crc_errors.append(info.filename)
+            raise RuntimeError(f"{info.filename}: {e}") from e
+
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        for result, target, tmp_path, dst in targets.values():
+            try:
+                dst.close()
+                os.replace(tmp_path, target)
+                os.utime(target, (mtime, mtime))
+                with self.lock:
+                    result.files += 1
+                    result.bytes += info.file_size
+            except OSError as e:
+                tmp_path.unlink(missing_ok=True)
+                self.fail(result, info.filename, e)
+
+    def fail(self, result: DestinationResult, member: str, error: Exception):
+        with self.lock:
+            result.errors[member] = str(error)
+
+    def extract_batch(self, batch: List[zipfile.ZipInfo]):
+        errors = []
+        for info in batch:
+            try:
+                self.extract_member(info)
+            except RuntimeError as e:
+                errors.append(str(e))
+        return errors
+
+    def batches(self, members: List[zipfile.ZipInfo]):
+        batch, batch_bytes = [], 0
+        for info in members:
+            batch.append(info)
+            batch_bytes += info.file_size
+            if len(batch) >= BATCH_FILES or batch_bytes >= BATCH_BYTES:
+                yield batch
+                batch, batch_bytes = [], 0
+        if batch:
+            yield batch
+
+    def report_progress(self, total_files: int, total_bytes: int):
+        for result in self.results:
+            with self.lock:
+                files, size = result.files, result.bytes
+            percent = size / total_bytes * 100 if total_bytes else 100.0
+            self.emit(
+                "progress",
+                f"{result.path}: {files}/{total_files} files, {percent:.0f}%",
+                destination=str(result.path), files=files, total_files=total_files, bytes=size, total_bytes=total_bytes
+            )
+
+    def run(self) -> bool:
+        with zipfile.ZipFile(self.zip_path) as archive:
+            infos = archive.infolist()
+        for info in infos:
+            name = PurePosixPath(info.filename)
+            if name.is_absolute() or ".." in name.parts or ":" in info.filename:
+                raise ValueError(f"Refusing to extract unsafe member name: {info.filename}")
+
+        members = [info for info in infos if not info.is_dir()]
+        for info in infos:
+            if info.is_dir():
+                for result in self.results:
+                    try:
+                        (result.path / info.filename).mkdir(parents=True, exist_ok=True)
+                    except OSError as e:
+                        self.fail(result, info.filename, e)
+        total_files = len(members)
+        total_bytes = sum(info.file_size for info in members)
+
+        start = time.monotonic()
+        self.emit(
+            "start",
+            f"Extracting {total_files} files ({total_bytes / 1024 / 1024:.1f} MB) to {len(self.results)} destination(s) on {self.workers} threads...",
+            zip=str(self.zip_path), destinations=[str(result.path) for result in self.results],
+            total_files=total_files, total_bytes=total_bytes, workers=self.workers
+        )
+        member_errors = []
+        last_report = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.extract_batch, batch) for batch in self.batches(members)]
+            for future in as_completed(futures):
+                member_errors.extend(future.result())
+                if time.monotonic() - last_report >= PROGRESS_INTERVAL_SECONDS:
+                    self.report_progress(total_files, total_bytes)
+                    last_report = time.monotonic()
+        self.report_progress(total_files, total_bytes)
+
+        for error in member_errors:
+            self.emit("error", f"[ERROR] Corrupted member {error}", error=error)
+        for result in self.results:
+            if result.errors:
+                member, error = next(iter(result.errors.items()))
+                message = f"[FAILED] {result.path}: {len(result.errors)} file(s) failed, first: {member}: {error}"
+            else:
+                message = f"[SUCCESS] {result.path}: {result.files} files, {result.bytes / 1024 / 1024:.1f} MB"
+            self.emit("result", message, **result.to_dict())
+
+        succeeded = not any(result.errors for result in self.results)
+        self.emit(
+            "done",
+            f"{'[SUCCESS] All' if succeeded else '[ERROR] Not all'} {len(self.results)} destination(s) extracted in {time.monotonic() - start:.1f}s.",
+            succeeded=succeeded, seconds=round(time.monotonic() - start, 3), corrupted_members=self.crc_errors
+        )
+        return succeeded
+
+    def report(self, succeeded: bool) -> Dict:
+        return {
+            "zip": str(self.zip_path),
+            "succeeded": succeeded,
+            "corrupted_members": self.crc_errors,
+            "destinations": [result.to_dict() for result in self.results],
+        }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extract a deployment zip into one or more destinations.")
+    parser.add_argument("zip_file", type=Path)
+    parser.add_argument("destinations", type=Path, nargs="+")
+    parser.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 1) * 4))
+    parser.add_argument("--json", action="store_true", help="Print progress and results as JSON lines.")
+    parser.add_argument("--report", type=Path, help="Write the per-destination results to this JSON file.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.zip_file.exists():
+        print(f"[ERROR] Zip file not found: {args.zip_file}")
+        sys.exit(1)
+
+    extractor = Extractor(args.zip_file, args.destinations, args.workers, json_output=args.json)
+    try:
+        succeeded = extractor.run()
+    except (ValueError, zipfile.BadZipFile) as e:
+        print(f"[ERROR] Failed to extract archive: {e}")
+        sys.exit(1)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(extractor.report(succeeded), f, indent=2)
+    sys.exit(0 if succeeded else 1)
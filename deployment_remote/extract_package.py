@@ -0,0 +1,118 @@
+'''
+Rebuilds webapp, service and TPAPI from a content-addressed package (built by deploy.py
+with "package_format": "cas") into one or more destinations.
+
+The package's blobs are first added to a blob store kept on this server, verified
+against their SHA-256 names. Every file listed in the manifest is then copied from
+the store to each destination. The store's index.json lists the blobs it holds. Give
+it to deploy.py as cas_known_blobs_path, and later packages will leave those blobs out.
+
+Usage: python extract_package.py "path\\to\\package.cas.zip" "blob_store_dir" "destination1" ["destination2" ...]
+Only the standard library is used, so the script can be copied to the server on its own.
+'''
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import zipfile
+from pathlib import Path
+
+PACKAGE_FORMAT = "cas-1"
+MANIFEST_NAME = "manifest.json"
+BLOB_DIR = "blobs"
+CHUNK_SIZE = 1024 * 1024
+WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+
+def blob_path(blob_store: Path, content_hash: str) -> Path:
+    return blob_store / content_hash[:2] / content_hash
+
+
+def store_blob(package: Path, blob_store: Path, content_hash: str, local: threading.local) -> bool:
+    '''Add one blob of the package to the store. Returns False if it was already there.'''
+    target = blob_path(blob_store, content_hash)
+    if target.exists():
+        return False
+    if not hasattr(local, "archive"):
+        local.archive = zipfile.ZipFile(package) # One handle per thread, reads are not thread-safe
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(f"{content_hash}.{threading.get_ident()}.tmp")
+    hasher = hashlib.sha256()
+    with local.archive.open(f"{BLOB_DIR}/{content_hash}") as src, open(tmp_path, 'wb') as dst:
+        while chunk := src.read(CHUNK_SIZE):
+            hasher.update(chunk)
+            dst.write(chunk)
+    if hasher.hexdigest() != content_hash:
+        tmp_path.unlink()
+        raise ValueError(f"Blob {content_hash} is corrupted (SHA-256 {hasher.hexdigest()}).")
+    os.replace(tmp_path, target)
+    return True
+
+
+def restore_file(blob_store: Path, destination: Path, arcname: str, entry: dict):
+    target = destination / arcname
+    target.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(blob_path(blob_store, entry["sha256"]), target)
+    os.utime(target, (entry["mtime"], entry["mtime"]))
+
+
+def write_index(blob_store: Path):
+    hashes = sorted(path.name for path in blob_store.glob("??/*") if not path.name.endswith(".tmp"))
+    with open(blob_store / "index.json", 'w') as f:
+        json.dump(hashes, f)
+
+
+def extract_package(package: Path, blob_store: Path, destinations: list) -> bool:
+    with zipfile.ZipFile(package) as archive:
+        manifest = json.loads(archive.read(MANIFEST_NAME))
+    if manifest.get("format") != PACKAGE_FORMAT:
+        print(f"[ERROR] Unsupported package format: {manifest.get('format')}")
+        return False
+
+    files = manifest["files"]
+    print(f"Package created {manifest['created']}: {len(files)} files, {len(manifest['blobs'])} blobs included.")
+
+    print("[STEP 1/2] Adding blobs to the blob store...")
+    local = threading.local()
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        added = sum(executor.map(lambda content_hash: store_blob(package, blob_store, content_hash, local), manifest["blobs"]))
+    write_index(blob_store)
+    print(f"[SUCCESS] {added} new blob(s) stored in {blob_store}.")
+
+    missing = sorted({entry["sha256"] for entry in files.values() if not blob_path(blob_store, entry["sha256"]).exists()})
+    if missing:
+        print(f"[ERROR] {len(missing)} blob(s) are neither in the package nor in the blob store, e.g. {missing[0]}.")
+        print("The package was built against blobs this server does not have. Rebuild it without cas_known_blobs_path.")
+        return False
+
+    print(f"[STEP 2/2] Restoring files to {len(destinations)} destination(s)...")
+    failed = 0
+    for destination in destinations:
+        with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+            futures = [executor.submit(restore_file, blob_store, destination, arcname, entry) for arcname, entry in files.items()]
+            errors = [future.exception() for future in futures if future.exception()]
+        if errors:
+            failed += 1
+            print(f"[FAILED] {destination}: {len(errors)} file(s) failed, first error: {errors[0]}")
+        else:
+            print(f"[SUCCESS] {destination}: {len(files)} files restored.")
+    return failed == 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print('Usage: python extract_package.py "path\\to\\package.cas.zip" "blob_store_dir" "destination1" ["destination2" ...]')
+        sys.exit(1)
+
+    package = Path(sys.argv[1])
+    if not package.exists():
+        print(f"[ERROR] Package not found: {package}")
+        sys.exit(1)
+
+    blob_store = Path(sys.argv[2])
+    blob_store.mkdir(parents=True, exist_ok=True)
+    sys.exit(0 if extract_package(package, blob_store, [Path(arg) for arg in sys.argv[3:]]) else 1)
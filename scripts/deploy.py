@@ -1,4 +1,6 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+import argparse
+import hashlib
 import os
 import shutil
 import sys
@@ -7,7 +9,7 @@ import logging
 import subprocess
 from pathlib import Path
 from datetime import datetime
-import zipfile
+from typing import Callable, Dict, List, Optional, Set
 
 from dotenv import load_dotenv
 
@@ -15,7 +17,14 @@ from dotenv import load_dotenv
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from utils.builder import Builder
-from utils.pipeline import SQLDeploymentPipeline
+from utils.cas_package import build_cas_package, load_blob_index
+from utils.delta_publish import MANIFEST_NAME, DeltaCopier, find_previous_package
+from utils.file_copy import ParallelCopier
+from utils.parallel_zip import ParallelZipWriter
+from utils.pipeline import ScriptRejected, SQLDeploymentPipeline
+from utils.run_journal import JOURNAL_NAME, RunJournal, fingerprint_paths
+from utils.task_graph import TaskGraph
+from utils.tracing import tracer
 
 
 def load_config(config_path: Path) -> dict:
@@ -64,18 +73,6 @@ def init_log_dir(base_dir: Path) -> Path:
     return log_dir 
 
 
-def copy_folder(src: Path, dst: Path, logger: logging.Logger):
-    try:
-        if not src.exists():
-            raise NotADirectoryError(f"Source directory {src} does not exist")
-        shutil.copytree(src, dst, dirs_exist_ok=True) # Create dst directory automatically
-        logger.debug(f"Copied {src} to {dst}.")
-
-    except Exception as e:
-        logger.error(f"Error occured while copying {src} to {dst}: {e}")
-        raise 
-        
-
 def move_file(src: Path, dst: Path, logger: logging.Logger):
     if src.exists():
         try:
@@ -90,7 +87,7 @@ def move_file(src: Path, dst: Path, logger: logging.Logger):
         logger.warning(f"Skip {src} because the file cannot be found.")
 
 
-def zip_with_7zip(folders, zip_path, sevenzip_path, logger: logging.Logger):
+def zip_with_7zip(folders, zip_path, sevenzip_path, logger: logging.Logger, zip_options: Optional[dict]=None):
     """Attempt to compress using external 7z.exe."""
     try:
         args = [sevenzip_path, 'a', '-tzip', str(zip_path)] + [str(f) for f in folders] + ['-mx=9']
@@ -105,23 +102,18 @@ def zip_with_7zip(folders, zip_path, sevenzip_path, logger: logging.Logger):
     
     except FileNotFoundError:
         logger.warning("7-Zip not found, falling back to Python zipfile")
-        zip_with_python(folders, zip_path, logger)
+        zip_with_python(folders, zip_path, logger, zip_options)
     
     except Exception as e:
         logger.warning("7-Zip not found, falling back to Python zipfile")
-        zip_with_python(folders, zip_path, logger)
+        zip_with_python(folders, zip_path, logger, zip_options)
 
 
-def zip_with_python(folders, zip_path, logger: logging.Logger):
-    """Fallback ZIP implementation using Python's zipfile."""
+def zip_with_python(folders, zip_path, logger: logging.Logger, zip_options: Optional[dict]=None):
+    """Fallback ZIP implementation, deflating on a thread pool."""
+    zip_options = zip_options or {}
     try:
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as z:
-            for folder in folders:
-                for root, _, files in os.walk(folder):
-                    for f in files:
-                        full_path = os.path.join(root, f)
-                        rel_path = os.path.relpath(full_path, os.path.dirname(folders[0]))
-                        z.write(full_path, rel_path)
+        zip_writer(zip_options, logger).write([Path(f) for f in folders], Path(zip_path))
         logger.info(f"Deployment package created successfully: {zip_path}")
     
     except Exception as e:
@@ -129,68 +121,307 @@ def zip_with_python(folders, zip_path, logger: logging.Logger):
         sys.exit(1)
 
 
-def build_solution(config, logger):
-    logger.info("Starting Build...")
-    builder = Builder(config.get('build_config', {}), custom_logger=logger)
-    builder.build()
-
-
-def deploy_sql(config: dict, db_connection: dict, log_dir, logger):
+def deploy_sql(
+    config: dict,
+    db_connection: dict,
+    log_dir,
+    logger,
+    journal: Optional[RunJournal]=None,
+    resuming: Optional[Callable[[], bool]]=None
+):
+    '''
+    resuming: Whether the SQL stage failed before with the same inputs. If not, the script
+    and database results of any earlier attempt in the journal are discarded.
+    '''
+    if journal and not (resuming and resuming()):
+        journal.reset_sql()
     logger.info("Starting SQL Deployment...")
     sql_pipeline = SQLDeploymentPipeline(
         config=config.get('update_schema_config', {}),
         db_connection=db_connection,
         log_directory=log_dir,
-        custom_logger=logger
+        custom_logger=logger,
+        journal=journal
     )
     sql_pipeline.run()
 
 
+def sql_fingerprint(config: dict, db_connection: dict) -> str:
+    '''The SQL stage reruns if its configuration or target server changed.'''
+    settings = {"config": config.get('update_schema_config', {}), "server": db_connection["server"]}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+# Environment specific files kept out of the package, under configs/<folder>/
+CONFIG_FILES = {
+    "webapp": ["web.config", "website.publishproj"],
+    "service": ["Service.exe.config", "LogicLayer.dll.config"],
+    "TPAPI": ["Web.config"],
+}
+
+
+# Deployment folders: source folder in the solution and the build target producing it
+ARTIFACT_FOLDERS = {
+    "webapp": (Path("webapp"), "LogicLayer"),
+    "service": (Path("service") / "bin" / "debug", "Service"),
+    "TPAPI": (Path("AnacleAPI.Interface") / "bin" / "app.publish", "AnacleAPI.Interface"),
+}
+
+
+def package_dir(config) -> Path:
+    return Path(config["destination_dir"]) / f"UAT_{datetime.now().strftime("%Y%m%d")}"
+
+
+def artifact_sources(config, folders) -> Dict[Path, str]:
+    solution_dir: Path = Path(config["build_config"]["solution_dir"])
+    return {solution_dir / ARTIFACT_FOLDERS[folder][0]: folder for folder in folders}
+
+
+def publishes_from_source(config) -> bool:
+    return config.get("package_format", "zip") == "cas" or config.get("zip_from_source", False)
+
+
 def publish_artifacts(config, logger):
+    with tracer.span("publish_artifacts"):
+        _publish_artifacts(config, logger)
+
+
+def _publish_artifacts(config, logger):
     logger.info("Publishing artifacts...")
-    solution_dir: Path = Path(config["build_config"]["solution_dir"])
-    dest_dir: Path = Path(config["destination_dir"]) / f"UAT_{datetime.now().strftime("%Y%m%d")}"
-    zip_output: bool = config.get("zip_output", True)
-    seven_zip_path: Path = Path(config.get("7zip_path", "C:/Program Files/7-Zip/7z.exe"))
-    remove_config_files = config.get("remove_config_files", True)
+    dest_dir = package_dir(config)
+    folders = list(ARTIFACT_FOLDERS)
+
+    if publishes_from_source(config):
+        publish_from_source(config, dest_dir, logger)
+        return
+
+    copy_artifacts(config, folders, dest_dir, logger)
+    package_artifacts(config, folders, dest_dir, logger)
+
 
-    folders_to_copy = ["webapp", "service", "TPAPI"] 
-    src_map = {
-        "webapp": solution_dir / "webapp",
-        "service": solution_dir / "service" / "bin" / "debug",
-        "TPAPI": solution_dir / "AnacleAPI.Interface" / "bin" / "app.publish",
+def publish_from_source(config, dest_dir: Path, logger):
+    sources = artifact_sources(config, list(ARTIFACT_FOLDERS))
+    if config.get("package_format", "zip") == "cas":
+        publish_cas_package(config, sources, dest_dir, logger)
+    else:
+        zip_from_source(config, sources, dest_dir, logger)
+
+
+def copy_artifacts(config, folders, dest_dir: Path, logger):
+    logger.info(f"Copying deployment folders {', '.join(folders)}...")
+    copy_options = {
+        "workers": config.get("copy_workers", 8),
+        "chunk_size": int(config.get("copy_chunk_mb", 8) * 1024 * 1024),
+        "logger": logger,
     }
+    sources = {src: dest_dir / folder for src, folder in artifact_sources(config, folders).items()}
+    try:
+        if config.get("delta_publish", False):
+            dest_dir.mkdir(parents=True, exist_ok=True)
+            DeltaCopier(dest_dir, find_previous_package(dest_dir), excluded=moved_config_files(config, folders), **copy_options).publish(sources)
+        else:
+            ParallelCopier(**copy_options).copy_trees(sources)
+    except Exception as e:
+        logger.error(f"Error occured while copying deployment folders to {dest_dir}: {e}")
+        raise
+
+
+def moved_config_files(config, folders) -> List[str]:
+    '''Paths, relative to the package, of the config files package_artifacts moves out of the package.'''
+    if not config.get("remove_config_files", True):
+        return []
+    return [f"{folder}/{cfg_file}" for folder in folders for cfg_file in CONFIG_FILES.get(folder, [])]
 
-    logger.info("Copying deployment folders...")
-    for folder in folders_to_copy:
-        copy_folder(src_map[folder], dest_dir / folder, logger)
+
+def package_artifacts(config, folders, dest_dir: Path, logger):
+    '''Move the config files out of the copied folders and zip them.'''
+    zip_output: bool = config.get("zip_output", True)
+    seven_zip_path: Path = Path(config.get("7zip_path", "C:/Program Files/7-Zip/7z.exe"))
+    remove_config_files = config.get("remove_config_files", True)
 
     if remove_config_files:
         logger.info("Removing config files...")
         config_dir = dest_dir / "configs"
-        config_files = {
-            "webapp": ["web.config", "website.publishproj"],
-            "service": ["Service.exe.config", "LogicLayer.dll.config"],
-            "TPAPI": ["Web.config"],
-        }
-
-        for folder in folders_to_copy:
-            for cfg_file in config_files.get(folder, []):
-                source = dest_dir / folder / cfg_file
-                dest = config_dir / folder / cfg_file
-                move_file(source, dest, logger)
+
+        with tracer.span("remove_config_files"):
+            for folder in folders:
+                for cfg_file in CONFIG_FILES.get(folder, []):
+                    source = dest_dir / folder / cfg_file
+                    dest = config_dir / folder / cfg_file
+                    move_file(source, dest, logger)
     
     if zip_output:
         logger.info("Zipping deployment package...")
-        folders_to_zip = [str(dest_dir / f) for f in folders_to_copy]
+        folders_to_zip = [str(dest_dir / f) for f in folders]
         zip_file = dest_dir / dest_dir.name
-        if seven_zip_path.exists():
-            zip_with_7zip(folders_to_zip, zip_file, seven_zip_path, logger)
-        else:
-            zip_with_python(folders_to_zip, zip_file, logger)
+        with tracer.span("zip", seven_zip=seven_zip_path.exists()) as span:
+            if seven_zip_path.exists():
+                zip_with_7zip(folders_to_zip, zip_file, seven_zip_path, logger, config)
+            else:
+                zip_with_python(folders_to_zip, zip_file, logger, config)
+            zip_path = zip_file if zip_file.exists() else zip_file.with_suffix(".zip")
+            if zip_path.exists():
+                span.set(bytes=zip_path.stat().st_size)
+
+
+def zip_writer(config, logger) -> ParallelZipWriter:
+    return ParallelZipWriter(
+        workers=config.get("zip_workers"),
+        level=config.get("zip_compression_level", 6),
+        stored_extensions=config.get("zip_stored_extensions"),
+        logger=logger
+    )
+
+
+def divert_config_files(config, sources, dest_dir: Path, logger) -> Set[str]:
+    '''
+    Copy the config files of the source folders to dest_dir/configs/<folder>/ and return
+    their arcnames (lowercase), to be left out of the package.
+    '''
+    excluded = set()
+    if not config.get("remove_config_files", True):
+        return excluded
+
+    logger.info("Diverting config files...")
+    config_dir = dest_dir / "configs"
+    with tracer.span("remove_config_files"):
+        for src, folder in sources.items():
+            for cfg_file in CONFIG_FILES.get(folder, []):
+                source = src / cfg_file
+                if not source.exists():
+                    logger.warning(f"Skip {source} because the file cannot be found.")
+                    continue
+                (config_dir / folder).mkdir(parents=True, exist_ok=True)
+                shutil.copy2(source, config_dir / folder / cfg_file)
+                excluded.add(f"{folder}/{cfg_file}".lower())
+                logger.debug(f"Copied {source} to {config_dir / folder / cfg_file}.")
+    return excluded
+
+
+def check_sources(sources):
+    for src in sources:
+        if not src.is_dir():
+            raise NotADirectoryError(f"Source directory {src} does not exist")
+
+
+def zip_from_source(config, sources, dest_dir: Path, logger):
+    '''
+    Zip the source folders straight into the package, without copying them to dest_dir
+    first. Config files are copied to dest_dir/configs/<folder>/ and left out of the
+    zip, as the copy, remove and zip steps would do.
+    '''
+    check_sources(sources)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    excluded = divert_config_files(config, sources, dest_dir, logger)
+
+    logger.info("Zipping deployment package from the solution folders...")
+    zip_file = dest_dir / dest_dir.name
+    with tracer.span("zip", seven_zip=False, from_source=True) as span:
+        _, bytes_out = zip_writer(config, logger).write_trees(sources, zip_file, exclude=excluded)
+        span.set(bytes=bytes_out)
+    logger.info(f"Deployment package created successfully: {zip_file}")
+
+
+def publish_cas_package(config, sources, dest_dir: Path, logger):
+    '''
+    Build a content-addressed package (manifest plus deduplicated blobs) from the source
+    folders, to be extracted with deployment_remote/extract_package.py. Config files are
+    diverted as for zip_from_source.
+    '''
+    check_sources(sources)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    excluded = divert_config_files(config, sources, dest_dir, logger)
+
+    known_blobs = set()
+    if config.get("cas_known_blobs_path"):
+        known_blobs = load_blob_index(Path(config["cas_known_blobs_path"]), logger)
+
+    logger.info("Building content-addressed deployment package...")
+    package_path = dest_dir / f"{dest_dir.name}.cas.zip"
+    build_cas_package(zip_writer(config, logger), sources, package_path, excluded, known_blobs, logger)
+    logger.info(f"Deployment package created successfully: {package_path}")
+
+
+def deployment_graph(config, builder: Builder, db_connection: dict, log_dir: Path, logger, journal: RunJournal) -> TaskGraph:
+    '''
+    Lay out the deployment as a task graph. Every build target waits for the targets it
+    depends on, and the SQL deployment only waits for LogicLayer. Each deployment folder
+    is copied as soon as its own build is done. The package is made once every copy is
+    done. Delta and from-source publishing work on all folders at once, so they wait for
+    every build.
+
+    Every task is fingerprinted for the journal: builds by their inputs, copies by their
+    source folders and the folders they copied to (without the config files the package
+    step moves out), and the package by the package folder. The package folder is kept in
+    the journal, so a run resumed on a later day finishes the same package.
+    '''
+    graph = TaskGraph(max_workers=config.get("deploy_workers", 4), logger=logger, journal=journal)
+    targets = builder.load_targets(Path(config["build_config"]["solution_dir"])).values()
+    for target in targets:
+        graph.add(
+            f"build:{target['name']}",
+            partial(builder.build_target, target["name"]),
+            [f"build:{dependency}" for dependency in target["dependency_names"]],
+            fingerprint=partial(builder.target_fingerprint, target["name"])
+        )
+    all_builds = [f"build:{target['name']}" for target in targets]
+
+    graph.add(
+        "sql",
+        partial(deploy_sql, config, db_connection, log_dir, logger, journal, partial(graph.resuming, "sql")),
+        ["build:LogicLayer"],
+        fingerprint=partial(sql_fingerprint, config, db_connection)
+    )
+
+    dest_dir = Path(journal.value("package_dir", str(package_dir(config))))
+    folders = list(ARTIFACT_FOLDERS)
+    all_sources = list(artifact_sources(config, folders))
+    moved_configs = [dest_dir / path for path in moved_config_files(config, folders)]
+    if publishes_from_source(config):
+        graph.add(
+            "package",
+            partial(publish_from_source, config, dest_dir, logger),
+            all_builds,
+            fingerprint=partial(fingerprint_paths, all_sources + [dest_dir])
+        )
+    elif config.get("delta_publish", False):
+        graph.add(
+            "copy",
+            partial(copy_artifacts, config, folders, dest_dir, logger),
+            all_builds,
+            fingerprint=partial(
+                fingerprint_paths, all_sources + [dest_dir / folder for folder in folders] + [dest_dir / MANIFEST_NAME], moved_configs
+            )
+        )
+        graph.add("package", partial(package_artifacts, config, folders, dest_dir, logger), ["copy"], fingerprint=partial(fingerprint_paths, [dest_dir]))
+    else:
+        for folder in folders:
+            graph.add(
+                f"copy:{folder}",
+                partial(copy_artifacts, config, [folder], dest_dir, logger),
+                [f"build:{ARTIFACT_FOLDERS[folder][1]}"],
+                fingerprint=partial(fingerprint_paths, list(artifact_sources(config, [folder])) + [dest_dir / folder], moved_configs)
+            )
+        graph.add(
+            "package",
+            partial(package_artifacts, config, folders, dest_dir, logger),
+            [f"copy:{folder}" for folder in folders],
+            fingerprint=partial(fingerprint_paths, [dest_dir])
+        )
+    return graph
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build, publish and deploy the solution.")
+    parser.add_argument(
+        "--resume", type=Path, metavar="RUN_DIR",
+        help="Resume a failed run from its log directory, skipping the stages that succeeded and whose inputs are unchanged."
+    )
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
     file_directory = Path(__file__)
     root_directory = file_directory.parent.parent
     env_path = root_directory / "configs" / ".env"
@@ -202,30 +433,36 @@ def main():
     db_connection = get_db_connection()
     
     # Initialize logging directory and logger
-    root_log_dir = Path(config.get('log_dir', './logs/deploy'))
-    log_dir = init_log_dir(root_log_dir)
+    if args.resume:
+        if not (args.resume / JOURNAL_NAME).exists():
+            print(f"Cannot resume: no {JOURNAL_NAME} in {args.resume}")
+            sys.exit(1)
+        log_dir = args.resume
+    else:
+        root_log_dir = Path(config.get('log_dir', './logs/deploy'))
+        log_dir = init_log_dir(root_log_dir)
     logger = init_logger(log_dir)
 
-    logger.info(f"Deployment process started.")
-
-    # Build LogicLayer, Service and API.Interface first
-    build_solution(config, logger)
+    logger.info(f"Deployment process {'resumed' if args.resume else 'started'}.")
+    journal = RunJournal(log_dir, logger)
 
-    # Update schema and prepare deployment zip file at the same time
-    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="Worker") as executor:
-        futures = {
-            executor.submit(deploy_sql, config, db_connection, log_dir, logger): "SQL Deployment",
-            executor.submit(publish_artifacts, config, logger): "Artifact Publish"
-        }
-
-        for future in as_completed(futures):
-            step = futures[future]
+    try:
+        with tracer.span("deployment", log_dir=str(log_dir), resumed=bool(args.resume)):
+            builder = Builder(config.get('build_config', {}), custom_logger=logger)
+            graph = deployment_graph(config, builder, db_connection, log_dir, logger, journal)
             try:
-                future.result()
-                logger.info(f"{step} completed.")
+                graph.run()
+            except ScriptRejected as e:
+                logger.error(f"Deployment stopped: {e}")
+                sys.exit(1)
             except Exception:
-                logger.exception(f"{step} failed.")
+                logger.exception("Deployment failed.")
                 sys.exit(1)
+            finally:
+                builder.log_decisions()
+    finally:
+        report_path = tracer.write_report(log_dir, chrome_trace=config.get("trace_chrome", False))
+        logger.info(f"Run report written to: {report_path}")
     
     logger.info(f"Deployment process completed.")
 
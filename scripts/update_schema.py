@@ -9,7 +9,8 @@ from dotenv import load_dotenv
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from utils.pipeline import SQLDeploymentPipeline
+from utils.pipeline import ScriptRejected, SQLDeploymentPipeline
+from utils.tracing import tracer
 
 def setup_logging(log_dir: Path):
     """Sets up logging to both console and file."""
@@ -74,4 +75,12 @@ if __name__ == "__main__":
     # Run the SQL deployment pipeline
     pipeline = SQLDeploymentPipeline(config, db_connection, log_directory=log_dir, custom_logger=logger)
 
-    pipeline.run()
+    try:
+        pipeline.run()
+    except ScriptRejected:
+        sys.exit(0) # Rejecting the script is not an error
+    except Exception:
+        sys.exit(1)
+    finally:
+        report_path = tracer.write_report(log_dir, chrome_trace=config.get("trace_chrome", False))
+        logger.info(f"Run report written to: {report_path}")
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from utils.async_downloader import AsyncScriptDownloader
+
+LOGIN_PAGE = b'''<html><body><form>
+<input type="hidden" name="__VIEWSTATE" value="state123" />
+<input type="hidden" name="__VIEWSTATEGENERATOR" value="gen456" />
+</form></body></html>'''
+
+SCRIPT = (
+    b"set nocount on\n"
+    b"print ('Syncing Customer ...')\n"
+    b"alter table Customer add Name nvarchar(100)\n"
+    b"print ('Customer synchronized ...')\n"
+    b"print ('Syncing Invoice ...')\n"
+    b"alter table Invoice add Total money\n"
+    b"print ('Invoice synchronized ...')\n"
+)
+
+
+class StubWebApp(BaseHTTPRequestHandler):
+    '''Login page that is unavailable for the first `unavailable` GETs, like IIS while reloading.'''
+    unavailable = 0
+    gets = 0
+    posts = []
+    parts_seen = []
+    download_dir = None
+    release = None # If set, the second half of the script waits for it
+
+    def do_GET(self):
+        type(self).gets += 1
+        if self.gets <= self.unavailable:
+            self.send_response(503)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(LOGIN_PAGE)))
+        self.end_headers()
+        self.wfile.write(LOGIN_PAGE)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.posts.append(parse_qs(body.decode()))
+        self.send_response(200)
+        self.send_header('Content-Disposition', 'attachment; filename="schema.sql"')
+        self.send_header('Content-Length', str(len(SCRIPT)))
+        self.end_headers()
+        half = len(SCRIPT) // 2
+        self.wfile.write(SCRIPT[:half])
+        self.wfile.flush()
+        deadline = time.monotonic() + 5
+        while not any(self.download_dir.iterdir()) and time.monotonic() < deadline:
+            time.sleep(0.01) # Wait for the client to open its file
+        self.parts_seen.append([path.name for path in self.download_dir.iterdir()])
+        if self.release is not None:
+            self.release.wait(5)
+        self.wfile.write(SCRIPT[half:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AsyncScriptDownloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.download_dir = Path(tempfile.mkdtemp())
+        StubWebApp.unavailable = 2
+        StubWebApp.gets = 0
+        StubWebApp.posts = []
+        StubWebApp.parts_seen = []
+        StubWebApp.download_dir = self.download_dir
+        StubWebApp.release = None
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubWebApp)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def downloader(self, **kwargs) -> AsyncScriptDownloader:
+        return AsyncScriptDownloader(
+            logger=logging.getLogger(__name__),
+            request_timeout=(5, 5),
+            initial_backoff=0.05,
+            max_backoff=0.1,
+            **kwargs
+        )
+
+    def test_polls_until_ready_then_streams_and_indexes_the_script(self):
+        blocks = []
+        downloader = self.downloader(ready_timeout=5)
+        downloaded = asyncio.run(downloader.download_script(
+            self.url, self.download_dir, on_block=lambda block, data: blocks.append((block.table, data))
+        ))
+
+        self.assertIsNotNone(downloaded)
+        self.assertEqual(StubWebApp.gets, 3) # Two 503s, then the login page
+        self.assertGreater(downloader.timings[self.url]["ready_seconds"], 0.05 + 0.1 - 0.01)
+
+        post = StubWebApp.posts[0]
+        self.assertEqual(post['__VIEWSTATE'], ['state123'])
+        self.assertEqual(post['__VIEWSTATEGENERATOR'], ['gen456'])
+        self.assertEqual(post['__EVENTTARGET'], ['buttonGenerateScript'])
+
+        self.assertEqual(StubWebApp.parts_seen, [['schema.sql.part']]) # Streamed through the .part file
+        self.assertEqual(sorted(path.name for path in self.download_dir.iterdir()), ['schema.sql'])
+        self.assertEqual(downloaded.path.read_bytes(), SCRIPT)
+        self.assertEqual(downloaded.size, len(SCRIPT))
+
+        self.assertEqual(sorted(downloaded.table_blocks), ['Customer', 'Invoice'])
+        customer = downloaded.table_blocks['Customer']
+        self.assertTrue(SCRIPT[customer.offset:customer.offset + customer.length].startswith(b"print ('Syncing Customer"))
+        self.assertEqual([table for table, _ in blocks], ['Customer', 'Invoice'])
+
+    def test_gives_up_when_not_ready_before_the_deadline(self):
+        StubWebApp.unavailable = 1000
+        downloaded = asyncio.run(self.downloader(ready_timeout=0.3).download_script(self.url, self.download_dir))
+
+        self.assertIsNone(downloaded)
+        self.assertGreater(StubWebApp.gets, 1)
+        self.assertEqual(StubWebApp.posts, [])
+        self.assertEqual(list(self.download_dir.iterdir()), [])
+
+    def test_cancelling_removes_the_partial_file(self):
+        StubWebApp.unavailable = 0
+        StubWebApp.release = threading.Event()
+
+        async def cancel_mid_download():
+            task = asyncio.create_task(self.downloader().download_script(self.url, self.download_dir))
+            while not StubWebApp.parts_seen:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            StubWebApp.release.set() # The rest of the script arrives after the cancellation
+
+        asyncio.run(cancel_mid_download()) # Waits for the worker thread to stop
+        self.assertEqual(StubWebApp.parts_seen, [['schema.sql.part']])
+        self.assertEqual(list(self.download_dir.iterdir()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from .atomic_file import write_json_atomic
+from .script_index import TableBlock
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+
+def target_key(connection_config: Dict) -> str:
+    return f"{connection_config['server']}/{connection_config['database']}"
+
+
+class AppliedTableState:
+    '''
+    Remembers, per target database, the hash of the last table block applied to it.
+    Stored as JSON: {"server/database": {"Table": "<block hash>", ...}, ...}
+    '''
+    def __init__(self, state_path: Path, logger: Optional[logging.Logger]=None):
+        self.state_path = state_path
+        self.logger = logger or module_logger
+        self.lock = threading.Lock()
+        self.state: Dict[str, Dict[str, str]] = self.load()
+
+    def load(self) -> Dict[str, Dict[str, str]]:
+        if not self.state_path.exists():
+            return {}
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable applied table state {self.state_path}: {e}")
+            return {}
+
+    def save(self):
+        write_json_atomic(self.state_path, self.state)
+
+    def changed_tables(self, targets: Iterable[str], table_blocks: Dict[str, TableBlock]) -> List[str]:
+        '''
+        Return the tables whose block hash differs from the last applied hash on any
+        of the targets, in script order. A target never seen before gets every table.
+        '''
+        targets = list(targets)
+        ordered_blocks = sorted(table_blocks.values(), key=lambda block: block.offset)
+        return [block.table for block in ordered_blocks if self.is_changed(targets, block)]
+
+    def is_changed(self, targets: Iterable[str], block: TableBlock) -> bool:
+        '''Whether the block differs from the last applied one on any of the targets.'''
+        return any(self.state.get(target, {}).get(block.table) != block.hash for target in targets)
+
+    def record(self, target: str, table_blocks: Dict[str, TableBlock], tables: Iterable[str]):
+        '''Record the given tables as applied to the target and persist the state.'''
+        with self.lock:
+            applied = self.state.setdefault(target, {})
+            for table in tables:
+                applied[table] = table_blocks[table].hash
+            self.save()
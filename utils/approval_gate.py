@@ -0,0 +1,128 @@
+from abc import ABC, abstractmethod
+import hmac
+import logging
+import secrets
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+POLL_SECONDS = 0.5
+
+
+class ApprovalGate(ABC):
+    '''
+    Asks for approval of a script without blocking the caller: request() starts asking
+    and returns at once, and wait() collects the answer, so other work can be done in
+    between. close() releases whatever the gate holds.
+    '''
+    def __init__(self, logger: Optional[logging.Logger]=None):
+        self.logger = logger or module_logger
+
+    @abstractmethod
+    def request(self, script_path: Path):
+        pass
+
+    @abstractmethod
+    def wait(self, timeout: Optional[float]=None) -> Optional[bool]:
+        '''Returns True if approved, False if rejected, or None if there was no answer within timeout seconds.'''
+
+    def close(self):
+        pass
+
+
+class ConsoleApprovalGate(ApprovalGate):
+    '''
+    Previews the script in a new console (validation_console.py) and takes its Y/N answer
+    over a loopback socket. The port is picked by the OS, so concurrent pipelines never
+    collide, and the answer must carry a random token that only this console was given.
+    Closing the console without answering counts as a rejection.
+    '''
+    def __init__(self, logger: Optional[logging.Logger]=None):
+        super().__init__(logger)
+        self.server: Optional[socket.socket] = None
+        self.process: Optional[subprocess.Popen] = None
+        self.token = secrets.token_hex(16)
+
+    def request(self, script_path: Path):
+        console_script = Path(__file__).parent / "validation_console.py"
+        if not console_script.exists():
+            raise FileNotFoundError(f"Cannot find {console_script}")
+
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.server.settimeout(POLL_SECONDS)
+        port = self.server.getsockname()[1]
+        self.process = subprocess.Popen(
+            [sys.executable, str(console_script), str(port), str(script_path), self.token],
+            creationflags=getattr(subprocess, "CREATE_NEW_CONSOLE", 0) # Windows only
+        )
+        self.logger.debug(f"Validation console started (pid {self.process.pid}), answering on port {port}.")
+
+    def read_answer(self, conn: socket.socket) -> Optional[bool]:
+        '''Returns the answer sent on the connection, or None if it does not carry the token.'''
+        conn.settimeout(POLL_SECONDS * 4)
+        try:
+            data = conn.recv(1024).decode(errors="replace")
+        except socket.timeout:
+            return None
+        token, _, answer = data.strip().partition(" ")
+        if not hmac.compare_digest(token, self.token):
+            self.logger.warning("Ignoring a validation answer without the expected token.")
+            return None
+        return answer.strip().upper() == "Y"
+
+    def wait(self, timeout: Optional[float]=None) -> Optional[bool]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        console_exited = False
+        while deadline is None or time.monotonic() < deadline:
+            try:
+                conn, _ = self.server.accept() # type: ignore
+            except socket.timeout:
+                if console_exited:
+                    self.logger.warning("Validation console closed without an answer.")
+                    return False
+                console_exited = self.process.poll() is not None # type: ignore # Accept once more in case it just answered
+                continue
+            with conn:
+                answer = self.read_answer(conn)
+            if answer is not None:
+                return answer
+        return None
+
+    def close(self):
+        if self.server:
+            self.server.close()
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+
+
+class AutoApprovalGate(ApprovalGate):
+    '''Headless policy that answers by itself after delay_seconds, for unattended runs and tests.'''
+    def __init__(self, approve: bool=True, delay_seconds: float=0.0, logger: Optional[logging.Logger]=None):
+        super().__init__(logger)
+        self.approve = approve
+        self.delay_seconds = delay_seconds
+
+    def request(self, script_path: Path):
+        self.logger.info(f"Script {script_path} will be {'approved' if self.approve else 'rejected'} automatically.")
+
+    def wait(self, timeout: Optional[float]=None) -> Optional[bool]:
+        if timeout is not None and self.delay_seconds > timeout:
+            time.sleep(timeout)
+            return None
+        time.sleep(self.delay_seconds)
+        return self.approve
+
+
+def create_approval_gate(policy: str, logger: Optional[logging.Logger]=None) -> ApprovalGate:
+    '''policy: "console", "auto_approve" or "auto_reject".'''
+    if policy == "console":
+        return ConsoleApprovalGate(logger)
+    if policy in ("auto_approve", "auto_reject"):
+        return AutoApprovalGate(approve=policy == "auto_approve", logger=logger)
+    raise ValueError(f"Invalid validation_gate option: {policy}")
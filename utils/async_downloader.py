@@ -0,0 +1,252 @@
+import asyncio
+from dataclasses import dataclass
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+from bs4 import BeautifulSoup
+
+from .script_index import CHUNK_SIZE, TableBlock, TableBlockIndexer
+from .tracing import tracer
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+
+def parse_hidden_fields(content: bytes) -> Dict[str, str]:
+    '''Extract the ASP.NET hidden fields required to post back to the login page.'''
+    soup = BeautifulSoup(content, 'html.parser')
+    return {
+        '__VIEWSTATE': soup.find('input', {'name': '__VIEWSTATE'})['value'], # type: ignore
+        '__VIEWSTATEGENERATOR': soup.find('input', {'name': '__VIEWSTATEGENERATOR'})['value'], # type: ignore
+    }
+
+
+def attachment_filename(headers, default: str='script.sql') -> Optional[str]:
+    '''Return the attachment filename of a response, or None if it is not an attachment.'''
+    content_disposition = headers.get('Content-Disposition', '')
+    if 'attachment' not in content_disposition:
+        return None
+    if 'filename=' in content_disposition:
+        return content_disposition.split('filename=')[1].strip('"')
+    return default
+
+
+@dataclass
+class DownloadedScript:
+    path: Path
+    content_hash: str # sha256 of the whole script
+    table_blocks: Dict[str, TableBlock] # Block index with block hashes, built while downloading
+    size: int
+
+
+# progress_callback(bytes_written, total_bytes or None, bytes_per_second)
+ProgressCallback = Callable[[int, Optional[int], float], None]
+
+
+class AsyncScriptDownloader:
+    '''
+    Downloads the schema sync script with asyncio, so several web app instances
+    can be downloaded from at once.
+
+    After a LogicLayer rebuild IIS takes a while to come back, so the login page is
+    polled with exponential backoff until it serves the ViewState fields or the
+    ready deadline passes. The generate-script POST is retried the same way.
+    The HTTP client is requests, so every request runs in a worker thread through
+    asyncio.to_thread and is bounded by request_timeout. Cancelling a download stops
+    its worker thread after the chunk being written and removes the partial file.
+    Phase timings of every download are kept in `timings`, keyed by URL.
+
+    The script is streamed to a temporary file in chunks (gzip/deflate transfer
+    encoding is decoded on the way) and renamed once complete. Each chunk is fed to
+    a TableBlockIndexer as it arrives, so the block index is ready when the download is.
+    '''
+    def __init__(
+        self,
+        logger: Optional[logging.Logger]=None,
+        ready_timeout: float=600,
+        request_timeout: Tuple[float, float]=(10, 600),
+        initial_backoff: float=1,
+        max_backoff: float=30,
+        post_attempts: int=3,
+        progress_callback: Optional[ProgressCallback]=None
+    ):
+        '''
+        ready_timeout: Total seconds to wait for the web app to become ready.\n
+        request_timeout: (connect, read) timeout in seconds of every request.\n
+        post_attempts: Number of attempts of the generate-script POST.\n
+        progress_callback: Called after every chunk written to disk.
+        '''
+        self.logger = logger or module_logger
+        self.ready_timeout = ready_timeout
+        self.request_timeout = request_timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.post_attempts = max(1, post_attempts)
+        self.progress_callback = progress_callback
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    async def wait_until_ready(self, session: requests.Session, base_url: str) -> Dict[str, str]:
+        '''Poll the login page until it returns the hidden fields. Returns the hidden fields.'''
+        deadline = time.monotonic() + self.ready_timeout
+        backoff = self.initial_backoff
+        attempt = 0
+
+        while True:
+            attempt += 1
+            try:
+                response = await asyncio.to_thread(session.get, base_url, timeout=self.request_timeout)
+                response.raise_for_status()
+                return parse_hidden_fields(response.content)
+            except Exception as e:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"{base_url} was not ready after {self.ready_timeout}s ({attempt} attempts): {e}")
+                self.logger.debug(f"{base_url} not ready yet (attempt {attempt}): {e}. Retrying in {backoff}s.")
+                await asyncio.sleep(min(backoff, remaining))
+                backoff = min(backoff * 2, self.max_backoff)
+
+    async def post_generate_script(
+        self,
+        session: requests.Session,
+        base_url: str,
+        hidden_fields: Dict[str, str]
+    ) -> requests.Response:
+        post_data = {
+            '__VIEWSTATE': hidden_fields['__VIEWSTATE'],
+            '__VIEWSTATEGENERATOR': hidden_fields['__VIEWSTATEGENERATOR'],
+            '__EVENTTARGET': 'buttonGenerateScript',
+            '__EVENTARGUMENT': '',
+        }
+
+        backoff = self.initial_backoff
+        for attempt in range(1, self.post_attempts + 1):
+            response = None
+            try:
+                response = await asyncio.to_thread(
+                    session.post, base_url, data=post_data, timeout=self.request_timeout, stream=True
+                )
+                response.raise_for_status()
+                return response
+            except Exception as e:
+                if response is not None:
+                    response.close()
+                if attempt == self.post_attempts:
+                    raise
+                self.logger.warning(f"Script generation failed (attempt {attempt}): {e}. Retrying in {backoff}s.")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        raise RuntimeError("unreachable")
+
+    def stream_to_file(
+        self, 
+        response: requests.Response, 
+        script_path: Path,
+        on_block: Optional[Callable[[TableBlock, bytes], None]]=None,
+        cancelled: Optional[threading.Event]=None,
+        on_segment: Optional[Callable[[bytes], None]]=None
+    ) -> DownloadedScript:
+        '''
+        Write the response body to script_path in chunks through a temporary file,
+        hashing and indexing every chunk on the way. on_block receives every table
+        block as soon as it has been downloaded, and on_segment the SQL outside the
+        blocks, in script order. Stops after the current chunk once
+        `cancelled` is set.
+        '''
+        total = None
+        if not response.headers.get('Content-Encoding') and response.headers.get('Content-Length'):
+            total = int(response.headers['Content-Length'])
+
+        hasher = hashlib.sha256()
+        indexer = TableBlockIndexer(hash_blocks=True, on_block=on_block, on_segment=on_segment)
+        written = 0
+        start = time.perf_counter()
+        tmp_path = script_path.with_name(script_path.name + ".part")
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE): # Decodes gzip/deflate
+                    if cancelled is not None and cancelled.is_set():
+                        raise RuntimeError("Download cancelled.")
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    indexer.feed(chunk)
+                    written += len(chunk)
+                    if self.progress_callback:
+                        elapsed = time.perf_counter() - start
+                        self.progress_callback(written, total, written / elapsed if elapsed > 0 else 0.0)
+            indexer.close()
+
+            if total is not None and written != total:
+                raise IOError(f"Download incomplete: received {written} of {total} bytes.")
+            os.replace(tmp_path, script_path)
+
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        finally:
+            response.close()
+
+        elapsed = time.perf_counter() - start
+        self.logger.debug(f"Streamed {written} bytes in {elapsed:.1f}s ({written / max(elapsed, 1e-6) / 1024 / 1024:.1f} MB/s).")
+        return DownloadedScript(script_path, hasher.hexdigest(), indexer.blocks, written)
+
+    async def download_script(
+        self, 
+        base_url: str, 
+        download_dir: Path,
+        on_block: Optional[Callable[[TableBlock, bytes], None]]=None,
+        on_segment: Optional[Callable[[bytes], None]]=None
+    ) -> Optional[DownloadedScript]:
+        timings = self.timings.setdefault(base_url, {})
+        try:
+            if not base_url or base_url.strip() == "":
+                raise ValueError("Base URL is required to download the script.")
+
+            with requests.Session() as session, tracer.span("download", url=base_url) as download_span:
+                start = time.perf_counter()
+                with tracer.span("download:ready"):
+                    hidden_fields = await self.wait_until_ready(session, base_url)
+                timings["ready_seconds"] = time.perf_counter() - start
+                self.logger.info(f"Web app ready after {timings['ready_seconds']:.1f}s: {base_url}")
+
+                start = time.perf_counter()
+                with tracer.span("download:post"):
+                    response = await self.post_generate_script(session, base_url, hidden_fields)
+                timings["post_seconds"] = time.perf_counter() - start
+
+                filename = attachment_filename(response.headers)
+                if filename is None:
+                    response.close()
+                    raise RuntimeError("No attachment found in response.")
+
+                download_dir.mkdir(parents=True, exist_ok=True)
+                script_path = download_dir / filename
+
+                start = time.perf_counter()
+                cancelled = threading.Event()
+                with tracer.span("download:stream") as stream_span:
+                    try:
+                        downloaded = await asyncio.to_thread(self.stream_to_file, response, script_path, on_block, cancelled, on_segment)
+                    except asyncio.CancelledError:
+                        cancelled.set() # The worker thread keeps running until it sees this
+                        raise
+                    stream_span.set(bytes=downloaded.size, table_blocks=len(downloaded.table_blocks))
+                timings["stream_seconds"] = time.perf_counter() - start
+                download_span.set(bytes=downloaded.size)
+
+            self.logger.info(f"Script downloaded successfully: {script_path}")
+            return downloaded
+
+        except Exception as e:
+            self.logger.error(f"An error occurred while downloading from {base_url}: {e}")
+            return None
+
+    async def download_many(self, targets: List[Tuple[str, Path]]) -> List[Optional[DownloadedScript]]:
+        '''Download from several (base_url, download_dir) targets concurrently.'''
+        return await asyncio.gather(*(self.download_script(url, path) for url, path in targets))
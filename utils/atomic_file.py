@@ -0,0 +1,27 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Optional
+
+
+def write_json_atomic(path: Path, data: Any, indent: Optional[int]=2):
+    '''
+    Write data as JSON to a uniquely named temporary file next to path, then rename it
+    over path. Readers never see a half-written file, and concurrent writers never
+    share a temporary file: the last rename wins.
+    '''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=path.parent, prefix=f"{path.name}.", suffix=".tmp", delete=False) as f:
+        tmp_path = Path(f.name)
+        try:
+            json.dump(data, f, indent=indent)
+        except BaseException:
+            f.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
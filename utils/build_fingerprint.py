@@ -0,0 +1,85 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from .atomic_file import write_json_atomic
+from .script_index import hash_file
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+# Build outputs and tool caches are not inputs
+EXCLUDED_DIRS = {"bin", "obj", ".vs", ".git", "node_modules", "packages"}
+
+
+class BuildFingerprints:
+    '''
+    Fingerprints of project inputs, stored after every successful build.
+
+    A fingerprint covers every file under the project's input paths (relative path,
+    size and mtime, or content hash if use_content_hash is True), the build command
+    and the fingerprints of the project's dependencies, so a rebuilt dependency
+    invalidates its dependents.
+    Stored as JSON: {"ProjectName": "<fingerprint>", ...}
+    '''
+    def __init__(self, state_path: Path, use_content_hash: bool=False, logger: Optional[logging.Logger]=None):
+        self.state_path = state_path
+        self.use_content_hash = use_content_hash
+        self.logger = logger or module_logger
+        self.lock = threading.Lock()
+        self.state: Dict[str, str] = self.load()
+
+    def load(self) -> Dict[str, str]:
+        if not self.state_path.exists():
+            return {}
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable build fingerprints {self.state_path}: {e}")
+            return {}
+
+    def save(self):
+        write_json_atomic(self.state_path, self.state)
+
+    def get(self, project: str) -> Optional[str]:
+        return self.state.get(project)
+
+    def record(self, project: str, fingerprint: str):
+        with self.lock:
+            self.state[project] = fingerprint
+            self.save()
+
+    def iter_files(self, path: Path) -> Iterable[Path]:
+        if path.is_file():
+            yield path
+            return
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d.lower() not in EXCLUDED_DIRS)
+            for filename in sorted(files):
+                yield Path(root) / filename
+
+    def compute(self, inputs: List[Path], command: str, dependency_fingerprints: List[str]) -> Optional[str]:
+        '''Returns the fingerprint of the inputs, or None if an input path does not exist.'''
+        hasher = hashlib.sha256()
+        hasher.update(command.encode())
+        for dependency_fingerprint in dependency_fingerprints:
+            hasher.update(dependency_fingerprint.encode())
+
+        for input_path in inputs:
+            if not input_path.exists():
+                self.logger.warning(f"Build input not found, cannot fingerprint: {input_path}")
+                return None
+            for path in self.iter_files(input_path):
+                stat = path.stat()
+                hasher.update(str(path.relative_to(input_path.parent)).encode())
+                if self.use_content_hash:
+                    hasher.update(hash_file(path).encode())
+                else:
+                    hasher.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+        return hasher.hexdigest()
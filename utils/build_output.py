@@ -0,0 +1,105 @@
+import gzip
+import logging
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Optional, Set
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+# msbuild console lines of interest
+PROJECT_STARTED = re.compile(r'^\s*Project "(?P<project>[^"]+)" on node \d+')
+CHILD_PROJECT_STARTED = re.compile(r'^\s*Project "[^"]+" \(\d+\) is building "(?P<project>[^"]+)" \(\d+\) on node \d+')
+PROJECT_FINISHED = re.compile(r'^\s*Done Building Project "(?P<project>[^"]+)"')
+WARNING_LINE = re.compile(r':\s*warning\s+[A-Z]*\d+\s*:', re.IGNORECASE)
+ERROR_LINE = re.compile(r':\s*error\s+[A-Z]*\d+\s*:', re.IGNORECASE)
+
+
+class RotatingCompressedLog:
+    '''
+    Line writer that rotates the file once it exceeds max_bytes. Rotated segments are
+    gzipped as <name>.1.gz (newest) ... <name>.<backup_count>.gz and older ones are dropped.
+    '''
+    def __init__(self, path: Path, max_bytes: int=50 * 1024 * 1024, backup_count: int=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, 'w', encoding='utf-8', errors='replace')
+        self.size = 0
+
+    def segment_path(self, index: int) -> Path:
+        return self.path.with_name(f"{self.path.name}.{index}.gz")
+
+    def write_line(self, line: str):
+        self.file.write(line)
+        self.size += len(line.encode('utf-8', errors='replace')) # max_bytes is in bytes, not characters
+        if self.size >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.file.close()
+        if self.backup_count > 0:
+            self.segment_path(self.backup_count).unlink(missing_ok=True)
+            for index in range(self.backup_count - 1, 0, -1):
+                if self.segment_path(index).exists():
+                    os.replace(self.segment_path(index), self.segment_path(index + 1))
+            with open(self.path, 'rb') as src, gzip.open(self.segment_path(1), 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        self.file = open(self.path, 'w', encoding='utf-8', errors='replace')
+        self.size = 0
+
+    def close(self):
+        self.file.close()
+
+
+class BuildProgress:
+    '''Follows msbuild output line by line and logs projects as they start and finish.'''
+    def __init__(self, step_name: str, logger: Optional[logging.Logger]=None):
+        self.step_name = step_name
+        self.logger = logger or module_logger
+        self.started: Set[str] = set()
+        self.finished: Set[str] = set()
+        self.warning_lines: Set[str] = set() # msbuild repeats them in its final summary
+        self.error_lines: Set[str] = set()
+
+    @property
+    def warnings(self) -> int:
+        return len(self.warning_lines)
+
+    @property
+    def errors(self) -> int:
+        return len(self.error_lines)
+
+    def feed(self, line: str):
+        match = PROJECT_STARTED.match(line) or CHILD_PROJECT_STARTED.match(line)
+        if match:
+            project = Path(match.group("project")).name
+            if project not in self.started:
+                self.started.add(project)
+                self.logger.info(f"{self.step_name}: started {project}")
+            return
+
+        match = PROJECT_FINISHED.match(line)
+        if match:
+            project = Path(match.group("project")).name
+            if project not in self.finished:
+                self.finished.add(project)
+                self.logger.info(
+                    f"{self.step_name}: finished {project} "
+                    f"({len(self.finished)}/{len(self.started)} projects, {self.warnings} warning(s), {self.errors} error(s))"
+                )
+            return
+
+        if ERROR_LINE.search(line):
+            message = line.strip()
+            if message not in self.error_lines:
+                self.error_lines.add(message)
+                self.logger.debug(f"{self.step_name}: {message}")
+        elif WARNING_LINE.search(line):
+            self.warning_lines.add(line.strip())
+
+    def summary(self) -> str:
+        return f"{len(self.finished)} project(s), {self.warnings} warning(s), {self.errors} error(s)"
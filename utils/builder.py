@@ -1,13 +1,45 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import closing
+import json
 import logging
+import os
 import subprocess
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional
+import xml.etree.ElementTree as ET
+
+from .build_fingerprint import BuildFingerprints
+from .build_output import BuildProgress, RotatingCompressedLog
+from .msbuild_log import MSBuildLogParser, find_regressions, load_previous_summary
+from .tracing import tracer
+
+# Tells msbuild not to build a project's references, for when they were built earlier in the same run
+NO_REFERENCES = "/p:BuildProjectReferences=false"
 
 class Builder:
     def __init__(self, config: Dict, custom_logger: Optional[logging.Logger] = None):
         self.config = config
-        self.logger = custom_logger or self._setup_logging(Path(config.get('log_dir', './logs/build')))
+        self.log_dir = Path(config.get('log_dir', './logs/build'))
+        self.logger = custom_logger or self._setup_logging(self.log_dir)
+        self.run_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        # What to do with a project whose inputs are unchanged since its last successful build:
+        # "rebuild" (always rebuild), "build" (incremental msbuild Build) or "skip"
+        self.unchanged_projects = config.get("unchanged_projects", "rebuild")
+        if self.unchanged_projects not in ("rebuild", "build", "skip"):
+            raise ValueError(f"Invalid unchanged_projects option: {self.unchanged_projects}")
+        self.fingerprints = BuildFingerprints(
+            Path(config.get("fingerprint_path", "./logs/build/fingerprints.json")),
+            use_content_hash=config.get("fingerprint_content_hash", False),
+            logger=self.logger
+        )
+        self.current_fingerprints: Dict[str, Optional[str]] = {}
+        self.decisions: Dict[str, Dict[str, str]] = {} # Project -> action taken and why
+        self.env: Optional[Dict[str, str]] = None
+        self.env_lock = threading.Lock()
 
     def _setup_logging(self, log_dir: Path):
         """Sets up logging to both console and file."""
@@ -40,15 +72,330 @@ class Builder:
         '''
         return ["LogicLayer", "Service", "AnacleAPI.Interface"]
 
-    def run_command(self, command: str, step_name: str):
-        self.logger.info(f"{step_name}...")
-        self.logger.debug(f"Command: {command}")
+    def get_targets(self, solution_dir: Path) -> Dict[int, Dict]:
+        '''
+        Returns the build targets by project ID. depends_on lists the IDs of the targets
+        that must be built first. build_cmd is the incremental variant of cmd, and inputs
+        are the paths fingerprinted to detect changes (overridable per project with
+        build_inputs). project_dir holds the target's .csproj. See command() for how project
+        references are handled.
+        '''
+        msbuild = self.config.get("msbuild_path", "msbuild")
+        abell_sol = solution_dir / "abell.sln"
+        interface = solution_dir / "AnacleAPI.Interface" / "AnacleAPI.Interface.csproj"
+
+        publish_interface = f'"{msbuild}" "{interface}" /p:DeployOnBuild=true /p:PublishProfile=DevOpsDebug /p:Configuration=Debug /v:m'
+
+        targets = {
+            1: {
+                "name": "LogicLayer",
+                "cmd": f'"{msbuild}" "{abell_sol}" /t:LogicLayer:Rebuild /v:diag',
+                "build_cmd": f'"{msbuild}" "{abell_sol}" /t:LogicLayer /v:diag',
+                "depends_on": [],
+                "project_dir": solution_dir / "LogicLayer",
+                "inputs": [solution_dir / "LogicLayer"],
+            },
+            2: {
+                "name": "Service",
+                "cmd": f'"{msbuild}" "{abell_sol}" /t:Service:Rebuild /v:diag',
+                "build_cmd": f'"{msbuild}" "{abell_sol}" /t:Service /v:diag',
+                "depends_on": [1],
+                "project_dir": solution_dir / "service",
+                "inputs": [solution_dir / "service"],
+            },
+            3: {
+                "name": "AnacleAPI.Interface",
+                "cmd": publish_interface,
+                "build_cmd": publish_interface,
+                "depends_on": [1],
+                "project_dir": interface.parent,
+                "inputs": [solution_dir / "AnacleAPI.Interface"],
+            },
+        }
+
+        build_inputs = self.config.get("build_inputs", {})
+        for target in targets.values():
+            if target["name"] in build_inputs:
+                target["inputs"] = [Path(path) for path in build_inputs[target["name"]]]
+        return targets
+
+    def load_dev_environment(self, dev_cmd_path: Path) -> Dict[str, str]:
+        '''
+        Run the developer command prompt once and capture the environment it sets up,
+        so every msbuild invocation can reuse it.
+        '''
+        if os.name == "nt":
+            command = f'"{dev_cmd_path}" >nul && set'
+        else:
+            command = f'. "{dev_cmd_path}" >/dev/null && env'
+
         result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        self.logger.debug(result.stdout)
         if result.returncode != 0:
-            self.logger.error(result.stderr)
-            raise RuntimeError(f"{step_name} failed: {result.stderr}")
-        self.logger.info(f"{step_name} completed successfully.")
+            raise RuntimeError(f"Failed to set up the developer environment: {result.stderr}")
+
+        env = {}
+        for line in result.stdout.splitlines():
+            if "=" in line:
+                key, value = line.split("=", 1)
+                env[key] = value
+        self.logger.debug(f"Developer environment loaded from {dev_cmd_path} ({len(env)} variables).")
+        return env
+
+    def load_targets(self, solution_dir: Path) -> Dict[int, Dict]:
+        '''Returns get_targets() with the names of each target's dependencies filled in.'''
+        projects = self.get_targets(solution_dir)
+        for target in projects.values():
+            target["dependency_names"] = [projects[dep]["name"] for dep in target["depends_on"]]
+        return projects
+
+    def dev_environment(self) -> Dict[str, str]:
+        '''The developer environment, loaded on first use and shared by every later build.'''
+        with self.env_lock:
+            if self.env is None:
+                dev_cmd_path = Path(self.config["dev_cmd_path"])
+                if not dev_cmd_path.exists():
+                    raise FileNotFoundError(f"Development command prompt not found: {dev_cmd_path}")
+                self.env = self.load_dev_environment(dev_cmd_path)
+            return self.env
+
+    def build_target(self, name: str):
+        '''
+        Build one target by name, raising on failure. Its dependencies must already be built,
+        as they are when the deployment task graph schedules the targets.
+        '''
+        solution_dir = Path(self.config["solution_dir"])
+        target = next((t for t in self.load_targets(solution_dir).values() if t["name"] == name), None)
+        if target is None:
+            raise ValueError(f"Unknown build target: {name}")
+        self.run_target(target, self.dev_environment(), references_built=True)
+
+    def command(self, target: Dict, action: str, references_built: bool) -> str:
+        '''
+        The msbuild command for the action ("rebuild" or "build"). If the target's dependencies
+        were built earlier in the same run and they are all its project references have, msbuild
+        is told not to build them again. Otherwise it builds them as project references, so a
+        target is never linked against stale ones.
+        '''
+        command = target["build_cmd"] if action == "build" else target["cmd"]
+        if references_built and target["depends_on"] and self.references_are_dependencies(target):
+            command += f" {NO_REFERENCES}"
+        return command
+
+    def project_references(self, project_dir: Path) -> Optional[List[str]]:
+        '''
+        Names of the projects referenced by the .csproj files in project_dir, from their
+        <ProjectReference Include="..."> items. Returns None if there is no readable .csproj.
+        '''
+        csproj_paths = sorted(project_dir.glob("*.csproj"))
+        if not csproj_paths:
+            return None
+
+        references = []
+        for csproj_path in csproj_paths:
+            try:
+                root = ET.parse(csproj_path).getroot()
+            except (ET.ParseError, OSError) as e:
+                self.logger.warning(f"Could not read {csproj_path}: {e}")
+                return None
+            for element in root.iter():
+                include = element.get("Include")
+                if element.tag.endswith("ProjectReference") and include:
+                    references.append(Path(include.replace("\\", "/")).stem)
+        return references
+
+    def references_are_dependencies(self, target: Dict) -> bool:
+        '''True if every project reference of the target is one of its depends_on targets.'''
+        name = target["name"]
+        references = self.project_references(target["project_dir"])
+        if references is None:
+            self.logger.info(f"No readable .csproj in {target['project_dir']}, {name} builds its project references.")
+            return False
+
+        dependencies = {dependency.lower() for dependency in target["dependency_names"]}
+        unlisted = sorted({reference for reference in references if reference.lower() not in dependencies})
+        if unlisted:
+            self.logger.info(f"{name} references {unlisted}, which are not built before it, so it builds its project references.")
+            return False
+        return True
+
+    def output_log_path(self, step_name: str) -> Path:
+        slug = "".join(c if c.isalnum() or c in "._-" else "_" for c in step_name)
+        return self.log_dir / f"{slug}_{self.run_timestamp}.log"
+
+    def run_command(self, command: str, step_name: str, env: Optional[Dict[str, str]]=None):
+        '''
+        Run a build command, streaming its output line by line to a rotating, gzipped log
+        file while following its progress. Only the last lines are kept in memory, to be
+        reported if the command fails. If reading the output fails, the command is killed.
+        '''
+        self.logger.info(f"{step_name}...")
+        self.logger.debug(f"Command: {command}")
+
+        progress = BuildProgress(step_name, self.logger)
+        timings = MSBuildLogParser()
+        recent_lines = deque(maxlen=self.config.get("build_error_tail_lines", 200))
+
+        with closing(RotatingCompressedLog(
+            self.output_log_path(step_name),
+            max_bytes=int(self.config.get("build_log_max_mb", 50) * 1024 * 1024),
+            backup_count=self.config.get("build_log_backups", 5)
+        )) as output_log:
+            process = subprocess.Popen(
+                command, shell=True, env=env, text=True, encoding="utf-8", errors="replace",
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+            )
+            try:
+                for line in process.stdout: # type: ignore
+                    output_log.write_line(line)
+                    recent_lines.append(line)
+                    progress.feed(line)
+                    timings.feed(line)
+                returncode = process.wait()
+            finally:
+                if process.poll() is None: # The output could not be read, do not leave msbuild running
+                    process.kill()
+                    process.wait()
+                process.stdout.close() # type: ignore
+
+        self.write_build_summary(command, step_name, timings, progress, succeeded=returncode == 0)
+
+        self.logger.debug(f"{step_name} output written to: {output_log.path} ({progress.summary()})")
+        if returncode != 0:
+            tail = "".join(recent_lines)
+            self.logger.error(tail)
+            raise RuntimeError(f"{step_name} failed with exit code {returncode} ({progress.summary()}). See {output_log.path}")
+        self.logger.info(f"{step_name} completed successfully ({progress.summary()}).")
+
+    def write_build_summary(self, command: str, step_name: str, timings: MSBuildLogParser, progress: BuildProgress, succeeded: bool):
+        '''
+        Store the timing summary of a build step next to its output log and, for a
+        successful step, log the targets that got slower than in the previous successful
+        run of the same command.
+        '''
+        summary_path = self.output_log_path(step_name).with_suffix(".summary.json")
+        summary = {
+            "step": step_name,
+            "command": command,
+            "timestamp": self.run_timestamp,
+            "succeeded": succeeded,
+            **timings.summary(self.config.get("build_summary_top_n", 10)),
+            "warnings": progress.warnings,
+            "errors": progress.errors,
+        }
+
+        previous = load_previous_summary(summary_path, command, self.logger) if succeeded else None
+        if previous:
+            previous_path, previous_summary = previous
+            summary["previous_summary"] = str(previous_path)
+            summary["regressions"] = find_regressions(
+                summary,
+                previous_summary,
+                threshold_percent=self.config.get("build_regression_threshold_percent", 25),
+                min_seconds=self.config.get("build_regression_min_seconds", 5)
+            )
+            for regression in summary["regressions"]:
+                self.logger.warning(
+                    f"{step_name}: {regression['name']} took {regression['seconds']:.1f}s, "
+                    f"up from {regression['previous_seconds']:.1f}s in {previous_summary['timestamp']}."
+                )
+
+        with open(summary_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+        slowest = ", ".join(f"{target['name']} {target['seconds']:.1f}s" for target in summary["slowest_targets"][:3])
+        self.logger.info(f"{step_name} took {summary['total_seconds']:.1f}s" + (f" (slowest targets: {slowest})" if slowest else "") + ".")
+        self.logger.debug(f"Build summary written to: {summary_path}")
+
+    def decide(self, target: Dict, fingerprint: Optional[str]):
+        '''Returns the action for the target ("rebuild", "build" or "skip") and the reason.'''
+        previous = self.fingerprints.get(target["name"])
+        if fingerprint is None:
+            return "rebuild", "inputs could not be fingerprinted"
+        if previous is None:
+            return "rebuild", "no previous successful build recorded"
+        if previous != fingerprint:
+            return "rebuild", "inputs or dependencies changed"
+        return self.unchanged_projects, "inputs unchanged since the last successful build"
+
+    def compute_fingerprint(self, target: Dict) -> Optional[str]:
+        dependency_fingerprints = []
+        for dep_name in target["dependency_names"]:
+            dep_fingerprint = self.current_fingerprints.get(dep_name, self.fingerprints.get(dep_name))
+            dependency_fingerprints.append(dep_fingerprint or "")
+        return self.fingerprints.compute(target["inputs"], target["cmd"], dependency_fingerprints)
+
+    def target_fingerprint(self, name: str) -> Optional[str]:
+        '''Fingerprint of the target's inputs, as computed by its build in this run if it ran.'''
+        if name in self.current_fingerprints:
+            return self.current_fingerprints[name]
+        solution_dir = Path(self.config["solution_dir"])
+        target = next((t for t in self.load_targets(solution_dir).values() if t["name"] == name), None)
+        return self.compute_fingerprint(target) if target else None
+
+    def run_target(self, target: Dict, env: Dict[str, str], references_built: bool=False):
+        name = target["name"]
+        with tracer.span(f"build:{name}") as span:
+            fingerprint = self.compute_fingerprint(target)
+            action, reason = self.decide(target, fingerprint)
+            self.decisions[name] = {"action": action, "reason": reason}
+            self.current_fingerprints[name] = fingerprint
+            span.set(action=action, reason=reason)
+
+            if action == "skip":
+                self.logger.info(f"Skipping {name}: {reason}.")
+                return
+
+            command = self.command(target, action, references_built)
+            self.logger.debug(f"{action.capitalize()} {name}: {reason}.")
+            self.run_command(command, f"Building/Publishing {name}", env)
+            if fingerprint is not None:
+                self.fingerprints.record(name, fingerprint)
+
+    def log_decisions(self):
+        for name, decision in self.decisions.items():
+            self.logger.info(f"{name}: {decision['action']} ({decision['reason']})")
+
+    def run_targets(self, targets: Dict[int, Dict], env: Dict[str, str]):
+        '''
+        Run the targets in dependency order, running independent targets concurrently
+        on up to build_workers workers. Dependencies outside the given targets are built by
+        msbuild as project references. Stops scheduling new targets after the first failure.
+        '''
+        max_workers = max(1, self.config.get("build_workers", 2))
+        pending = dict(targets)
+        done = set()
+        running = {}
+        errors = []
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="BuildWorker") as executor:
+            while pending or running:
+                if not errors:
+                    ready = [
+                        target_id for target_id, target in pending.items()
+                        if all(dep in done or dep not in targets for dep in target["depends_on"])
+                    ]
+                    for target_id in ready:
+                        target = pending.pop(target_id)
+                        references_built = all(dep in targets for dep in target["depends_on"])
+                        future = executor.submit(tracer.wrap(self.run_target), target, env, references_built)
+                        running[future] = target_id
+
+                if not running:
+                    if pending and not errors:
+                        raise ValueError(f"Circular build dependencies between targets {list(pending)}")
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    target_id = running.pop(future)
+                    try:
+                        future.result()
+                        done.add(target_id)
+                    except Exception as e:
+                        errors.append(e)
+
+        if errors:
+            raise errors[0]
 
     def build(self, project_id: Optional[int]=None):
         try:
@@ -59,38 +406,25 @@ class Builder:
             if not dev_cmd_path.exists():
                 raise FileNotFoundError(f"Development command prompt not found: {dev_cmd_path}")
 
-            dev_cmd = f'"{dev_cmd_path}"'
-            abell_sol = solution_dir / "abell.sln"
-            interface = solution_dir / "AnacleAPI.Interface" / "AnacleAPI.Interface.csproj"
-
-            projects = {
-                1: {
-                    "name": "LogicLayer",
-                    "cmd": f'{dev_cmd} && msbuild {abell_sol} /t:LogicLayer:Rebuild /v:diag',
-                },
-                2: {
-                    "name": "Service",
-                    "cmd": f'{dev_cmd} && msbuild {abell_sol} /t:Service:Rebuild /v:diag',
-                },
-                3: {
-                    "name": "AnacleAPI.Interface",
-                    "cmd": f'{dev_cmd} && msbuild "{interface}" /p:DeployOnBuild=true /p:PublishProfile=DevOpsDebug /p:Configuration=Debug /v:m'
-                },
-            }
+            projects = self.load_targets(solution_dir)
 
             # Build all if no specific project is passed
             if project_id is None:
-                targets = projects.values()
+                targets = projects
             elif project_id in projects:
-                targets = [projects[project_id]]
+                targets = {project_id: projects[project_id]}
             else:
                 raise ValueError(f"Unknown project ID: {project_id}")
 
-            for target in targets:
-                self.run_command(target["cmd"], f"Building/Publishing {target['name']}")
+            with tracer.span("build"):
+                env = self.dev_environment()
+                try:
+                    self.run_targets(targets, env)
+                finally:
+                    self.log_decisions()
 
             self.logger.info("✅ All build tasks completed successfully.")
 
         except Exception as e:
             self.logger.exception(f"❌ Build process failed.")
-            exit(1)
\ No newline at end of file
+            exit(1)
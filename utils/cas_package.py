@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from .parallel_zip import ParallelZipWriter, ZipMember
+from .script_index import hash_file
+from .tracing import tracer
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+PACKAGE_FORMAT = "cas-1"
+MANIFEST_NAME = "manifest.json"
+BLOB_DIR = "blobs"
+
+
+def load_blob_index(index_path: Path, logger: Optional[logging.Logger]=None) -> Set[str]:
+    '''Hashes of the blobs a target already has, as written by extract_package.py into its blob store.'''
+    logger = logger or module_logger
+    if not index_path.exists():
+        logger.warning(f"Blob index {index_path} not found, including every blob.")
+        return set()
+    with open(index_path, 'r') as f:
+        return set(json.load(f))
+
+
+def build_cas_package(
+    writer: ParallelZipWriter,
+    sources: Dict[Path, str],
+    package_path: Path,
+    exclude: Optional[Set[str]]=None,
+    known_blobs: Optional[Set[str]]=None,
+    logger: Optional[logging.Logger]=None
+) -> Dict:
+    '''
+    Writes a content-addressed package: a zip holding manifest.json and one blobs/<sha256>
+    entry per unique file content, so the DLLs shared by webapp, service and TPAPI are
+    stored once. The manifest maps every arcname to its hash, size and mtime.
+    Blobs in known_blobs are left out, for a target whose blob store already holds them.
+    Returns the manifest.
+    '''
+    logger = logger or module_logger
+    known_blobs = known_blobs or set()
+
+    with tracer.span("cas_package") as span:
+        members = writer.members(sources, exclude)
+        with ThreadPoolExecutor(max_workers=writer.workers, thread_name_prefix="HashWorker") as executor:
+            hashes = list(executor.map(lambda member: hash_file(member.path), members))
+
+        files = {}
+        blobs: Dict[str, ZipMember] = {}
+        for member, content_hash in zip(members, hashes):
+            files[member.arcname] = {
+                "sha256": content_hash,
+                "size": member.size,
+                "mtime": member.path.stat().st_mtime,
+            }
+            if content_hash not in known_blobs and content_hash not in blobs:
+                blobs[content_hash] = ZipMember(member.path, f"{BLOB_DIR}/{content_hash}", member.size, member.stored)
+
+        manifest = {
+            "format": PACKAGE_FORMAT,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "files": files,
+            "blobs": sorted(blobs),
+        }
+        writer.write_members(
+            sorted(blobs.values(), key=lambda blob: blob.arcname),
+            package_path,
+            extra_files={MANIFEST_NAME: json.dumps(manifest, indent=2).encode()}
+        )
+
+        total_bytes = sum(member.size for member in members)
+        unique_bytes = sum({content_hash: member.size for member, content_hash in zip(members, hashes)}.values())
+        blob_bytes = sum(blob.size for blob in blobs.values())
+        span.set(files=len(members), unique_blobs=len(set(hashes)), blobs=len(blobs), bytes=total_bytes, blob_bytes=blob_bytes)
+
+    logger.info(
+        f"Package {package_path.name}: {len(members)} files, {len(set(hashes))} unique "
+        f"({(total_bytes - unique_bytes) / 1024 / 1024:.1f} MB of duplicates), "
+        f"{len(blobs)} blobs included ({blob_bytes / 1024 / 1024:.1f} MB)."
+    )
+    return manifest
@@ -0,0 +1,203 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    '''
+    Thread-safe pool of warm DB-API connections keyed by (server, database).
+
+    Idle connections are health-checked before reuse and replaced if they fail.
+    The number of open connections per server is capped at max_per_server, or at the
+    server's entry in server_limits. When the
+    cap is reached, an idle connection to another database on that server is closed
+    to make room, otherwise acquire() waits for a connection to be released.
+    Acquire waits and hold times are recorded and summarised by stats().
+    '''
+    def __init__(
+        self,
+        driver=None,
+        max_per_server: int=8,
+        health_check_sql: str="SELECT 1",
+        logger: Optional[logging.Logger]=None,
+        server_limits: Optional[Dict[str, int]]=None
+    ):
+        '''
+        driver: DB-API module used to connect. Defaults to pyodbc.\n
+        server_limits: Per-server overrides of max_per_server.
+        '''
+        if driver is None:
+            import pyodbc
+            driver = pyodbc
+        self.driver = driver
+        self.max_per_server = max(1, max_per_server)
+        self.server_limits = {server: max(1, limit) for server, limit in (server_limits or {}).items()}
+        self.health_check_sql = health_check_sql
+        self.logger = logger or module_logger
+
+        self.condition = threading.Condition()
+        self.idle: Dict[Tuple[str, str], List] = defaultdict(list)
+        self.open_count: Dict[str, int] = defaultdict(int)
+        self.connection_strings: Dict[Tuple, str] = {}
+        self.checked_out: Dict[int, float] = {} # id(connection) -> acquire time
+
+        self.counters = defaultdict(int)
+        self.acquire_seconds: List[float] = []
+        self.held_seconds: List[float] = []
+
+    def connection_string(self, connection_config: Dict) -> str:
+        key = tuple(sorted(connection_config.items()))
+        connection_string = self.connection_strings.get(key)
+        if connection_string is None:
+            parts = [f"{k}={v}" for k, v in connection_config.items()]
+            connection_string = 'driver={SQL Server};' + ';'.join(parts) + ';'
+            self.connection_strings[key] = connection_string
+        return connection_string
+
+    def limit(self, server: str) -> int:
+        return self.server_limits.get(server, self.max_per_server)
+
+    def count(self, counter: str):
+        with self.condition:
+            self.counters[counter] += 1
+
+    def is_healthy(self, conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self.health_check_sql)
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception as e:
+            self.logger.debug(f"Discarding unhealthy pooled connection: {e}")
+            return False
+
+    def close_connection(self, conn):
+        try:
+            conn.close()
+        except Exception as e:
+            self.logger.debug(f"Error while closing pooled connection: {e}")
+
+    def acquire(self, connection_config: Dict):
+        '''Return a connection to the configured database, reusing a warm one if possible.'''
+        server, database = connection_config["server"], connection_config["database"]
+        key = (server, database)
+        start = time.perf_counter()
+
+        while True:
+            conn = None
+            evicted = None
+            with self.condition:
+                while True:
+                    if self.idle[key]:
+                        conn = self.idle[key].pop()
+                        break
+                    if self.open_count[server] < self.limit(server):
+                        self.open_count[server] += 1
+                        break
+                    other_key = next((k for k, conns in self.idle.items() if k[0] == server and conns), None)
+                    if other_key:
+                        evicted = self.idle[other_key].pop() # Make room for this database
+                        break
+                    self.condition.wait()
+
+            if evicted is not None:
+                self.close_connection(evicted)
+                self.count("evicted")
+
+            if conn is not None:
+                if self.is_healthy(conn):
+                    self.count("reused")
+                    break
+                self.close_connection(conn)
+                self.count("discarded")
+                with self.condition:
+                    self.open_count[server] -= 1
+                    self.condition.notify()
+                continue
+
+            try:
+                conn = self.driver.connect(self.connection_string(connection_config), autocommit=False)
+            except Exception:
+                with self.condition:
+                    self.open_count[server] -= 1
+                    self.condition.notify()
+                raise
+            self.count("created")
+            break
+
+        acquired_at = time.perf_counter()
+        with self.condition:
+            self.checked_out[id(conn)] = acquired_at
+            self.acquire_seconds.append(acquired_at - start)
+        return conn
+
+    def release(self, conn, connection_config: Dict, discard: bool=False):
+        '''Return a connection to the pool. Discarded connections are closed instead.'''
+        server, database = connection_config["server"], connection_config["database"]
+        with self.condition:
+            acquired_at = self.checked_out.pop(id(conn), None)
+            if acquired_at is not None:
+                self.held_seconds.append(time.perf_counter() - acquired_at)
+            if discard:
+                self.open_count[server] -= 1
+            else:
+                self.idle[(server, database)].append(conn)
+            self.condition.notify()
+
+        if discard:
+            self.close_connection(conn)
+            self.count("discarded")
+
+    @contextmanager
+    def connection(self, connection_config: Dict):
+        '''
+        Acquire a connection for the duration of the block. If the block raises, the
+        transaction is rolled back and the connection is discarded rather than reused.
+        '''
+        conn = self.acquire(connection_config)
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception as e:
+                self.logger.debug(f"Rollback failed: {e}")
+            self.release(conn, connection_config, discard=True)
+            raise
+        else:
+            self.release(conn, connection_config)
+
+    def stats(self) -> Dict:
+        with self.condition:
+            acquire_seconds = list(self.acquire_seconds)
+            held_seconds = list(self.held_seconds)
+            counters = dict(self.counters)
+        return {
+            "acquired": len(acquire_seconds),
+            "created": counters.get("created", 0),
+            "reused": counters.get("reused", 0),
+            "discarded": counters.get("discarded", 0),
+            "evicted": counters.get("evicted", 0),
+            "acquire_seconds_total": round(sum(acquire_seconds), 3),
+            "acquire_seconds_max": round(max(acquire_seconds, default=0.0), 3),
+            "held_seconds_total": round(sum(held_seconds), 3),
+            "held_seconds_max": round(max(held_seconds, default=0.0), 3),
+        }
+
+    def close_all(self):
+        with self.condition:
+            conns = [conn for conns in self.idle.values() for conn in conns]
+            for (server, _), idle_conns in self.idle.items():
+                self.open_count[server] -= len(idle_conns)
+            self.idle.clear()
+        for conn in conns:
+            self.close_connection(conn)
@@ -0,0 +1,161 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .applied_state import target_key
+from .atomic_file import write_json_atomic
+from .tracing import tracer
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DatabaseRun:
+    server: str
+    database: str
+    wave: int
+    queue_seconds: float = 0.0
+    run_seconds: float = 0.0
+    error: Optional[Exception] = None
+    skipped: bool = False # Not run because an earlier wave failed
+
+
+class DatabaseScheduler:
+    '''
+    Runs a task against many databases with at most max_per_server of them in flight
+    per SQL Server, or the server's entry in server_limits. Servers run concurrently.
+
+    Databases are run in waves: the canary databases (by name or "server/database") first,
+    then the rest, and a wave only starts once the previous one succeeded. Within a wave,
+    databases are started longest first according to the durations recorded in
+    history_path, so the slowest ones do not end up at the tail. Databases without
+    history are started first.
+    '''
+    def __init__(
+        self,
+        max_per_server: int=4,
+        canary_databases: Optional[Iterable[str]]=None,
+        history_path: Optional[Path]=None,
+        logger: Optional[logging.Logger]=None,
+        server_limits: Optional[Dict[str, int]]=None
+    ):
+        self.max_per_server = max(1, max_per_server)
+        self.server_limits = {server: max(1, limit) for server, limit in (server_limits or {}).items()}
+        self.canary_databases = set(canary_databases or [])
+        self.history_path = history_path
+        self.logger = logger or module_logger
+        self.lock = threading.Lock()
+        self.history: Dict[str, float] = self.load_history()
+
+    def load_history(self) -> Dict[str, float]:
+        if not self.history_path or not self.history_path.exists():
+            return {}
+        try:
+            with open(self.history_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable database duration history {self.history_path}: {e}")
+            return {}
+
+    def save_history(self):
+        if not self.history_path:
+            return
+        write_json_atomic(self.history_path, self.history)
+
+    def limit(self, server: str) -> int:
+        '''Maximum number of databases in flight on server.'''
+        return self.server_limits.get(server, self.max_per_server)
+
+    def plan(self, connection_configs: List[Dict]) -> List[List[Dict]]:
+        '''Split the databases into waves, each ordered by historical duration, longest first.'''
+        def is_canary(config: Dict) -> bool:
+            return config["database"] in self.canary_databases or target_key(config) in self.canary_databases
+
+        canaries = [c for c in connection_configs if is_canary(c)]
+        rest = [c for c in connection_configs if not is_canary(c)]
+
+        def expected_duration(config: Dict) -> float:
+            return self.history.get(target_key(config), float("inf"))
+
+        return [
+            sorted(wave, key=expected_duration, reverse=True)
+            for wave in (canaries, rest) if wave
+        ]
+
+    def run(self, connection_configs: List[Dict], task: Callable[[Dict], None]) -> List[DatabaseRun]:
+        '''
+        Run task(connection_config) for every database. Exceptions are captured in the
+        returned DatabaseRun records, and databases in waves after a failed one are skipped.
+        '''
+        runs: List[DatabaseRun] = []
+        failed = False
+        parent_thread_name = threading.current_thread().name
+
+        waves = self.plan(connection_configs)
+        for wave_number, wave in enumerate(waves):
+            wave_runs = [DatabaseRun(c["server"], c["database"], wave_number) for c in wave]
+            runs.extend(wave_runs)
+            if failed:
+                for run in wave_runs:
+                    run.skipped = True
+                continue
+
+            self.logger.info(f"Starting wave {wave_number} on {len(wave)} database(s): {[c['database'] for c in wave]}")
+
+            # One bounded pool per server. Jobs are queued in plan order and started FIFO.
+            executors: Dict[str, ThreadPoolExecutor] = {}
+            futures = []
+            for config, run in zip(wave, wave_runs):
+                server = config["server"]
+                if server not in executors:
+                    executors[server] = ThreadPoolExecutor(
+                        max_workers=self.limit(server),
+                        thread_name_prefix=f"{parent_thread_name}-dbworker"
+                    )
+                futures.append(executors[server].submit(tracer.wrap(self.run_one), task, config, run, time.perf_counter()))
+
+            wait(futures)
+            for executor in executors.values():
+                executor.shutdown()
+
+            failed = any(run.error for run in wave_runs)
+            if failed and wave_number + 1 < len(waves):
+                self.logger.error(f"Wave {wave_number} failed. Skipping the remaining database(s).")
+
+        self.save_history()
+        self.log_report(runs)
+        return runs
+
+    def run_one(self, task: Callable[[Dict], None], config: Dict, run: DatabaseRun, queued_at: float):
+        started_at = time.perf_counter()
+        run.queue_seconds = started_at - queued_at
+        with tracer.span(f"database:{run.database}", server=run.server, wave=run.wave, queue_seconds=round(run.queue_seconds, 3)):
+            try:
+                task(config)
+            except Exception as e:
+                run.error = e
+            finally:
+                run.run_seconds = time.perf_counter() - started_at
+
+        if run.error is None:
+            with self.lock:
+                self.history[target_key(config)] = round(run.run_seconds, 3)
+
+    def log_report(self, runs: List[DatabaseRun]):
+        for run in runs:
+            if run.skipped:
+                status = "skipped"
+            elif run.error:
+                status = "failed"
+            else:
+                status = "ok"
+            self.logger.info(
+                f"Database {run.database}: wave {run.wave}, {status}, "
+                f"queued {run.queue_seconds:.2f}s, ran {run.run_seconds:.2f}s"
+            )
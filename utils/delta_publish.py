@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from .atomic_file import write_json_atomic
+from .file_copy import CopyJob, CopyStats, ParallelCopier
+from .script_index import hash_file
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+
+def load_manifest(package_dir: Path, logger: Optional[logging.Logger]=None) -> Optional[Dict]:
+    manifest_path = package_dir / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        (logger or module_logger).warning(f"Ignoring unreadable package manifest {manifest_path}: {e}")
+        return None
+
+
+def find_previous_package(package_dir: Path, pattern: str="UAT_*") -> Optional[Path]:
+    '''
+    Returns the package to publish against: package_dir itself when it is being published
+    again, otherwise the latest other package with a manifest next to it.
+    '''
+    if (package_dir / MANIFEST_NAME).exists():
+        return package_dir
+    candidates = sorted(
+        (path for path in package_dir.parent.glob(pattern) if path != package_dir and (path / MANIFEST_NAME).exists()),
+        key=lambda path: path.name,
+        reverse=True
+    )
+    return candidates[0] if candidates else None
+
+
+class DeltaCopier(ParallelCopier):
+    '''
+    Publishes source trees into package_dir against the manifest of a previous package.
+
+    Source files are compared with the previous manifest by size and modification time,
+    then by content hash if only the time differs. Unchanged files are hardlinked from the
+    previous package (or left alone if already in place) and only new or changed files
+    are copied. A new manifest with every file's size, mtime and hash, and the files
+    deleted since the previous package, is written to package_dir.
+    Manifest paths are relative to package_dir, with forward slashes.
+
+    excluded: Manifest paths (case-insensitive) of files that are moved out of the package
+    after publishing, such as config files. They are always copied and left out of the manifest.
+    '''
+    def __init__(self, package_dir: Path, previous_dir: Optional[Path], excluded: Optional[Iterable[str]]=None, **kwargs):
+        super().__init__(**kwargs)
+        self.package_dir = package_dir
+        self.previous_dir = previous_dir
+        self.excluded = {key.lower() for key in excluded or []}
+        previous = load_manifest(previous_dir, self.logger) if previous_dir else None
+        self.previous_files: Dict[str, Dict] = previous["files"] if previous else {}
+        self.previous_manifest = previous or {}
+        self.files: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def manifest_key(self, job: CopyJob) -> str:
+        return job.dst.relative_to(self.package_dir).as_posix()
+
+    def link(self, source: Path, job: CopyJob) -> bool:
+        '''Hardlink source to the job's destination. Returns False where hardlinks are not supported.'''
+        try:
+            job.dst.unlink(missing_ok=True)
+            os.link(source, job.dst)
+            return True
+        except OSError as e:
+            self.logger.debug(f"Cannot hardlink {source} to {job.dst}, copying instead: {e}")
+            return False
+
+    def publish_file(self, job: CopyJob, key: str, stats: CopyStats) -> str:
+        '''Bring one file up to date in the package and return its content hash.'''
+        previous = self.previous_files.get(key)
+        content_hash = None
+        if previous and previous["size"] == job.size:
+            if previous["mtime_ns"] != job.mtime_ns:
+                content_hash = hash_file(job.src)
+            if content_hash in (None, previous["sha256"]):
+                if job.dst.exists() and job.dst.stat().st_size == job.size and self.previous_dir == self.package_dir:
+                    stats.unchanged += 1
+                    return previous["sha256"]
+                previous_file = self.previous_dir / key # type: ignore
+                if previous_file.exists() and self.link(previous_file, job):
+                    stats.linked += 1
+                    return previous["sha256"]
+
+        self.copy_file(job)
+        stats.files += 1
+        stats.bytes += job.size
+        return content_hash or hash_file(job.dst)
+
+    def copy_batch(self, batch: List[CopyJob]) -> CopyStats:
+        stats = CopyStats()
+        for job in batch:
+            key = self.manifest_key(job)
+            if key.lower() in self.excluded:
+                self.copy_file(job)
+                stats.files += 1
+                stats.bytes += job.size
+                continue
+            content_hash = self.publish_file(job, key, stats)
+            with self.lock:
+                self.files[key] = {"size": job.size, "mtime_ns": job.mtime_ns, "sha256": content_hash}
+        return stats
+
+    def publish(self, sources: Dict[Path, Path]) -> CopyStats:
+        '''Copy the changed files of every source into package_dir and write its manifest.'''
+        if self.previous_dir:
+            self.logger.info(f"Publishing changes against {self.previous_dir} ({len(self.previous_files)} files).")
+        stats = self.copy_trees(sources)
+
+        deleted = {key for key in set(self.previous_files) - set(self.files) if key.lower() not in self.excluded}
+        for key in deleted:
+            (self.package_dir / key).unlink(missing_ok=True) # Left over when publishing the same package again
+        if deleted:
+            self.logger.info(f"{len(deleted)} file(s) deleted since the previous package.")
+
+        previous_package = str(self.previous_dir) if self.previous_dir else None
+        if self.previous_dir == self.package_dir:
+            # Published again: keep the package and deletions it was first published against
+            previous_package = self.previous_manifest.get("previous_package")
+            deleted = (deleted | set(self.previous_manifest.get("deleted", []))) - set(self.files)
+
+        manifest = {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "previous_package": previous_package,
+            "deleted": sorted(deleted),
+            "files": dict(sorted(self.files.items())),
+        }
+        write_json_atomic(self.package_dir / MANIFEST_NAME, manifest)
+        return stats
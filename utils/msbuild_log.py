@@ -0,0 +1,172 @@
+import json
+import logging
+import re
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .build_output import CHILD_PROJECT_STARTED, PROJECT_FINISHED, PROJECT_STARTED
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+# /v:diag target lines, with or without the ": (TargetId:n)" suffix of newer msbuild versions
+TARGET_STARTED = re.compile(r'^\s*Target "(?P<target>[^":]+)(?::[^"]*)?" in (?:file "[^"]*" from )?project "(?P<project>[^"]+)"')
+TARGET_FINISHED = re.compile(r'^\s*Done building target "(?P<target>[^":]+)(?::[^"]*)?" in project "(?P<project>[^"]+)"')
+# Performance summary printed at the end of a /v:diag build
+SUMMARY_SECTION = re.compile(r'^\s*(?P<section>Project|Target|Task) Performance Summary:')
+SUMMARY_ENTRY = re.compile(r'^\s*(?P<ms>\d+) ms\s+(?P<name>.+?)\s+(?P<calls>\d+) calls')
+TIME_ELAPSED = re.compile(r'^\s*Time Elapsed (?P<hours>\d+):(?P<minutes>\d+):(?P<seconds>\d+(?:\.\d+)?)')
+
+
+class Timings:
+    '''Elapsed seconds and call counts by name.'''
+    def __init__(self):
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+
+    def add(self, name: str, seconds: float, calls: int=1):
+        self.seconds[name] += seconds
+        self.calls[name] += calls
+
+    def top(self, count: int) -> List[Dict]:
+        slowest = sorted(self.seconds.items(), key=lambda item: item[1], reverse=True)[:count]
+        return [{"name": name, "seconds": round(seconds, 3), "calls": self.calls[name]} for name, seconds in slowest]
+
+
+class MSBuildLogParser:
+    '''
+    Extracts per-project and per-target elapsed times from msbuild output, one line at a time.
+
+    The performance summary msbuild prints at the end of a /v:diag build is used when
+    present. Otherwise, targets and projects are timed from the arrival of their start
+    and "Done building" lines. Warnings and errors are counted by BuildProgress.
+    '''
+    def __init__(self):
+        self.start = time.monotonic()
+        self.elapsed: Optional[float] = None
+        self.targets = Timings()
+        self.projects = Timings()
+        self.summary_targets = Timings()
+        self.summary_projects = Timings()
+        self.running_targets: Dict[Tuple[str, str], float] = {}
+        self.running_projects: Dict[str, float] = {}
+        self.section: Optional[str] = None
+
+    def feed(self, line: str):
+        if self.section:
+            match = SUMMARY_ENTRY.match(line)
+            if match:
+                timings = {"Project": self.summary_projects, "Target": self.summary_targets}.get(self.section)
+                if timings is not None:
+                    name = match.group("name")
+                    if self.section == "Project":
+                        name = Path(name).name
+                    timings.add(name, int(match.group("ms")) / 1000, int(match.group("calls")))
+                return
+            self.section = None
+
+        # Cheap check first, most /v:diag lines are property and item dumps
+        stripped = line.lstrip()
+        if not stripped or stripped[0] not in "TDP":
+            return
+
+        now = time.monotonic()
+        match = TARGET_STARTED.match(line)
+        if match:
+            self.running_targets[(Path(match.group("project")).name, match.group("target"))] = now
+            return
+
+        match = TARGET_FINISHED.match(line)
+        if match:
+            started = self.running_targets.pop((Path(match.group("project")).name, match.group("target")), None)
+            if started is not None:
+                self.targets.add(match.group("target"), now - started)
+            return
+
+        match = PROJECT_STARTED.match(line) or CHILD_PROJECT_STARTED.match(line)
+        if match:
+            self.running_projects.setdefault(Path(match.group("project")).name, now)
+            return
+
+        match = PROJECT_FINISHED.match(line)
+        if match:
+            project = Path(match.group("project")).name
+            started = self.running_projects.pop(project, None)
+            if started is not None:
+                self.projects.add(project, now - started)
+            return
+
+        match = SUMMARY_SECTION.match(line)
+        if match:
+            self.section = match.group("section")
+            return
+
+        match = TIME_ELAPSED.match(line)
+        if match:
+            self.elapsed = (
+                int(match.group("hours")) * 3600 + int(match.group("minutes")) * 60 + float(match.group("seconds"))
+            )
+
+    def summary(self, top_n: int=10) -> Dict:
+        from_performance_summary = bool(self.summary_targets.seconds)
+        targets = self.summary_targets if from_performance_summary else self.targets
+        projects = self.summary_projects if self.summary_projects.seconds else self.projects
+        total = self.elapsed if self.elapsed is not None else time.monotonic() - self.start
+        return {
+            "total_seconds": round(total, 3),
+            "timing_source": "performance_summary" if from_performance_summary else "output",
+            "slowest_targets": targets.top(top_n),
+            "slowest_projects": projects.top(top_n),
+        }
+
+
+def find_regressions(current: Dict, previous: Dict, threshold_percent: float, min_seconds: float) -> List[Dict]:
+    '''
+    Compare the total time and the slowest targets with a previous summary. A regression
+    is a slowdown of more than threshold_percent that also exceeds min_seconds.
+    '''
+    def compare(name: str, now: float, before: Optional[float]):
+        if before is None or now - before < min_seconds or now <= before * (1 + threshold_percent / 100):
+            return None
+        percent = round((now - before) / before * 100, 1) if before else None
+        return {"name": name, "seconds": now, "previous_seconds": before, "increase_percent": percent}
+
+    regressions = []
+    total = compare("(total)", current["total_seconds"], previous.get("total_seconds"))
+    if total:
+        regressions.append(total)
+
+    previous_targets = {target["name"]: target["seconds"] for target in previous.get("slowest_targets", [])}
+    for target in current["slowest_targets"]:
+        regression = compare(target["name"], target["seconds"], previous_targets.get(target["name"]))
+        if regression:
+            regressions.append(regression)
+    return regressions
+
+
+def load_previous_summary(summary_path: Path, command: str, logger: Optional[logging.Logger]=None) -> Optional[Tuple[Path, Dict]]:
+    '''
+    Returns the latest earlier successful summary of the same step and command. Summaries
+    are named <step>_<timestamp>.summary.json, so they sort by time.
+    '''
+    logger = logger or module_logger
+    step_prefix = summary_path.name.rsplit("_", 2)[0]
+    pattern = re.compile(rf"^{re.escape(step_prefix)}_\d{{8}}_\d{{6}}\.summary\.json$")
+    candidates = sorted(
+        (path for path in summary_path.parent.glob(f"{step_prefix}_*.summary.json") if pattern.match(path.name)),
+        reverse=True
+    )
+    for path in candidates:
+        if path.name >= summary_path.name:
+            continue
+        try:
+            with open(path, 'r') as f:
+                summary = json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable build summary {path}: {e}")
+            continue
+        if summary.get("succeeded") and summary.get("command") == command:
+            return path, summary
+    return None
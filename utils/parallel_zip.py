@@ -0,0 +1,245 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+import logging
+import os
+import posixpath
+import time
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from .tracing import tracer
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+# Formats that are already compressed, deflating them only costs time
+STORED_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico",
+    ".zip", ".gz", ".7z", ".rar", ".nupkg",
+    ".woff", ".woff2", ".mp3", ".mp4",
+}
+
+
+@dataclass
+class ZipMember:
+    path: Path
+    arcname: str
+    size: int
+    stored: bool
+
+
+@dataclass
+class ZipPiece:
+    '''A chunk_size slice of a member, compressed on its own.'''
+    member: ZipMember
+    offset: int
+    length: int
+
+    @property
+    def first(self) -> bool:
+        return self.offset == 0
+
+    @property
+    def last(self) -> bool:
+        return self.offset + self.length >= self.member.size
+
+
+class ParallelZipWriter:
+    '''
+    Zip writer that deflates members on a thread pool (zlib releases the GIL while
+    compressing) and writes them in a deterministic, sorted order.
+
+    Members are cut into chunk_size pieces, so large files are compressed by several
+    workers like pigz does: every piece is a raw deflate stream ended with a sync flush
+    and the last one is finished, which concatenate into one valid stream. Small files
+    are grouped so each task holds about chunk_size bytes. At most 2 x workers tasks are
+    in flight, which bounds memory. Files with a STORED_EXTENSIONS extension, and
+    single-piece files that deflate does not shrink, are stored.
+    '''
+    def __init__(
+        self,
+        workers: Optional[int]=None,
+        level: int=6,
+        chunk_size: int=4 * 1024 * 1024,
+        stored_extensions: Optional[Iterable[str]]=None,
+        logger: Optional[logging.Logger]=None
+    ):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.level = level
+        self.chunk_size = chunk_size
+        self.stored_extensions: Set[str] = {ext.lower() for ext in (stored_extensions or STORED_EXTENSIONS)}
+        self.logger = logger or module_logger
+
+    def members(self, sources: Dict[Path, str], exclude: Optional[Set[str]]=None) -> List[ZipMember]:
+        '''
+        Lists the files of every source folder, named <prefix>/<path in folder>.
+        Arcnames in exclude (lowercase) are left out.
+        '''
+        exclude = exclude or set()
+        members = []
+        for folder, prefix in sources.items():
+            for root, dirs, files in os.walk(folder):
+                dirs.sort()
+                for filename in sorted(files):
+                    path = Path(root) / filename
+                    arcname = posixpath.join(prefix, Path(os.path.relpath(path, folder)).as_posix())
+                    if arcname.lower() in exclude:
+                        continue
+                    members.append(ZipMember(
+                        path,
+                        arcname,
+                        path.stat().st_size,
+                        path.suffix.lower() in self.stored_extensions
+                    ))
+        return members
+
+    def tasks(self, members: List[ZipMember]) -> Iterable[List[ZipPiece]]:
+        task: List[ZipPiece] = []
+        task_size = 0
+        for member in members:
+            for offset in range(0, max(member.size, 1), self.chunk_size):
+                piece = ZipPiece(member, offset, min(self.chunk_size, member.size - offset))
+                task.append(piece)
+                task_size += piece.length
+                if task_size >= self.chunk_size:
+                    yield task
+                    task, task_size = [], 0
+        if task:
+            yield task
+
+    def compress(self, task: List[ZipPiece]) -> List[Tuple[ZipPiece, bytes, bytes]]:
+        '''Returns every piece with its raw and compressed (or stored) data.'''
+        results = []
+        for piece in task:
+            with open(piece.member.path, 'rb') as f:
+                f.seek(piece.offset)
+                data = f.read(piece.length)
+            if piece.member.stored:
+                results.append((piece, data, data))
+                continue
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            flush_mode = zlib.Z_FINISH if piece.last else zlib.Z_SYNC_FLUSH
+            results.append((piece, data, compressor.compress(data) + compressor.flush(flush_mode)))
+        return results
+
+    def write(self, folders: List[Path], zip_path: Path) -> Tuple[int, int]:
+        '''
+        Zip the folders, with member names relative to the parent of the first folder.
+        Returns the number of bytes read and written.
+        '''
+        base_dir = folders[0].parent
+        return self.write_trees({folder: Path(os.path.relpath(folder, base_dir)).as_posix() for folder in folders}, zip_path)
+
+    def write_trees(self, sources: Dict[Path, str], zip_path: Path, exclude: Optional[Set[str]]=None) -> Tuple[int, int]:
+        '''
+        Zip every source folder under its arcname prefix, leaving out the arcnames in exclude.
+        Returns the number of bytes read and written.
+        '''
+        return self.write_members(self.members(sources, exclude), zip_path)
+
+    def write_members(self, members: List[ZipMember], zip_path: Path, extra_files: Optional[Dict[str, bytes]]=None) -> Tuple[int, int]:
+        '''
+        Zip the members in order, followed by extra_files (arcname -> content) written as is.
+        Returns the number of bytes read and written.
+        '''
+        start = time.monotonic()
+        with tracer.span("python_zip", workers=self.workers, level=self.level) as span:
+            bytes_in = sum(member.size for member in members)
+
+            with zipfile.ZipFile(zip_path, 'w') as archive, \
+                 ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ZipWorker") as executor:
+                in_flight: Deque[Future] = deque()
+                writer = MemberWriter(archive)
+                try:
+                    for task in self.tasks(members):
+                        in_flight.append(executor.submit(self.compress, task))
+                        if len(in_flight) >= 2 * self.workers:
+                            writer.write(in_flight.popleft().result())
+                    while in_flight:
+                        writer.write(in_flight.popleft().result())
+                except Exception:
+                    for future in in_flight:
+                        future.cancel()
+                    raise
+                for arcname, content in (extra_files or {}).items():
+                    archive.writestr(arcname, content, zipfile.ZIP_DEFLATED)
+
+            bytes_out = zip_path.stat().st_size
+            seconds = time.monotonic() - start
+            span.set(files=len(members), bytes_in=bytes_in, bytes_out=bytes_out)
+
+        self.logger.info(
+            f"Zipped {len(members)} files ({bytes_in / 1024 / 1024:.1f} MB to {bytes_out / 1024 / 1024:.1f} MB) "
+            f"in {seconds:.1f}s on {self.workers} threads: {bytes_in / 1024 / 1024 / max(seconds, 1e-6):.1f} MB/s."
+        )
+        return bytes_in, bytes_out
+
+
+class MemberWriter:
+    '''
+    Appends already compressed members to an open ZipFile, in the order their pieces arrive.
+
+    The local header is written before the first piece and rewritten with the CRC and sizes
+    after the last one, as ZipFile.open(..., 'w') does. The members are then registered
+    with the ZipFile so close() writes the central directory, with ZIP64 records as needed.
+    '''
+    def __init__(self, archive: zipfile.ZipFile):
+        self.archive = archive
+        self.fp = archive.fp
+        self.info: Optional[zipfile.ZipInfo] = None
+        self.zip64 = False
+
+    def write(self, results: List[Tuple[ZipPiece, bytes, bytes]]):
+        for piece, data, compressed in results:
+            if piece.first:
+                self.start(piece.member, single_piece=piece.last, data=data, compressed=compressed)
+                if piece.last:
+                    continue
+            else:
+                self.append(data, compressed)
+            if piece.last:
+                self.finish()
+
+    def start(self, member: ZipMember, single_piece: bool, data: bytes, compressed: bytes):
+        info = zipfile.ZipInfo.from_file(member.path, member.arcname)
+        info.compress_type = zipfile.ZIP_STORED if member.stored else zipfile.ZIP_DEFLATED
+        info.file_size = member.size
+        info.compress_size = 0
+        info.CRC = 0
+        info.header_offset = self.fp.tell()
+        self.info = info
+        self.zip64 = member.size * 1.05 > zipfile.ZIP64_LIMIT
+
+        if single_piece:
+            if not member.stored and len(compressed) >= len(data):
+                info.compress_type = zipfile.ZIP_STORED
+                compressed = data
+            info.CRC = zlib.crc32(data)
+            info.compress_size = len(compressed)
+            self.fp.write(info.FileHeader(self.zip64))
+            self.fp.write(compressed)
+            self.register()
+        else:
+            self.fp.write(info.FileHeader(self.zip64)) # Rewritten by finish()
+            self.append(data, compressed)
+
+    def append(self, data: bytes, compressed: bytes):
+        self.info.CRC = zlib.crc32(data, self.info.CRC) # type: ignore
+        self.info.compress_size += len(compressed) # type: ignore
+        self.fp.write(compressed)
+
+    def finish(self):
+        end = self.fp.tell()
+        self.fp.seek(self.info.header_offset) # type: ignore
+        self.fp.write(self.info.FileHeader(self.zip64)) # type: ignore
+        self.fp.seek(end)
+        self.register()
+
+    def register(self):
+        self.archive.filelist.append(self.info) # type: ignore
+        self.archive.NameToInfo[self.info.filename] = self.info # type: ignore
+        self.archive.start_dir = self.fp.tell() # type: ignore
+        self.info = None
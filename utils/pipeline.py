@@ -1,124 +1,90 @@
+import asyncio
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import partial
 import os
-import socket
-import subprocess
-import sys
 import threading
 from dotenv import load_dotenv
-import requests
 import pyodbc
 import logging
 from pathlib import Path
-from typing import Dict, List, Optional
-from bs4 import BeautifulSoup
+from typing import Dict, List, Optional, Tuple
+
+from .applied_state import AppliedTableState, target_key
+from .approval_gate import create_approval_gate
+from .async_downloader import AsyncScriptDownloader
+from .connection_pool import ConnectionPool
+from .db_scheduler import DatabaseRun, DatabaseScheduler
+from .run_journal import RunJournal
+from .script_cache import ScriptCache
+from .script_index import TableBlock, copy_block, hash_file, index_script, read_block, script_declarations
+from .streaming import BlockStreamer
+from .target_inventory import load_targets, result_matrix, run_results, write_result_matrix
+from .tracing import tracer
 
 # Module-level fallback logger
 module_logger = logging.getLogger(__name__)
 
-class ScriptDownloader:
-    def __init__(self, logger: Optional[logging.Logger]=None):
-        self.session = requests.Session()
-        self.logger = logger or module_logger
+FILTERED_SCRIPT_HEADER = "set nocount on\ndeclare @xmls nvarchar(max)\n\n"
+FILTERED_SCRIPT_FOOTER = "set nocount off\n"
+DOWNLOAD_PROGRESS_INTERVAL = 50 * 1024 * 1024 # Log download progress every 50 MB
+PREVALIDATION_OPTIONS = {"parseonly": "PARSEONLY", "noexec": "NOEXEC"} # Syntax only, or also compile against the schema
 
-    def _get_hidden_fields(self, base_url):
-        response = self.session.get(base_url) # IIS refresh takes some time. No need timeout
-        soup = BeautifulSoup(response.content, 'html.parser')
-        return {
-            '__VIEWSTATE': soup.find('input', {'name': '__VIEWSTATE'})['value'], # type: ignore
-            '__VIEWSTATEGENERATOR': soup.find('input', {'name': '__VIEWSTATEGENERATOR'})['value'], # type: ignore
-        }
+class ScriptRejected(Exception):
+    '''The script was not approved for execution.'''
 
-    def download_script(self, base_url: str, download_dir: Path) -> Optional[Path]:
-        try:
-            if not base_url or base_url.strip() == "":
-                raise ValueError("Base URL is required to download the script.")
-
-            hidden_fields = self._get_hidden_fields(base_url)
-            post_data = {
-                '__VIEWSTATE': hidden_fields['__VIEWSTATE'],
-                '__VIEWSTATEGENERATOR': hidden_fields['__VIEWSTATEGENERATOR'],
-                '__EVENTTARGET': 'buttonGenerateScript',
-                '__EVENTARGUMENT': '',
-            }
-            
-            response = self.session.post(base_url, data=post_data)
-            
-            if 'attachment' in response.headers.get('Content-Disposition', ''):
-                content_disposition = response.headers.get('Content-Disposition', '')
-                filename = 'script.sql'
-                if 'filename=' in content_disposition:
-                    filename = content_disposition.split('filename=')[1].strip('"')
-                    
-                if not download_dir.exists():
-                    download_dir.mkdir(parents=True)
-
-                filename = download_dir / filename  
-                with open(filename, 'wb') as f:
-                    f.write(response.content)
-                    
-                self.logger.info(f"Script downloaded successfully: {filename}")
-                return filename
-            else:
-                raise RuntimeError("No attachment found in response.")
-            
-        except Exception as e:
-            self.logger.error(f"An error occurred: {e}")
-            return None
-        
 class ScriptParser:
     def __init__(self, logger: Optional[logging.Logger]=None):
         self.logger = logger or module_logger
 
-    def parse_script(self, script_path: Path, selected_tables: list[str]) -> Optional[Path]:
-        table_blocks = self.generate_table_blocks(script_path)
-        filtered_script = self.generate_filtered_script(table_blocks, selected_tables)
+    def parse_script(
+        self, 
+        script_path: Path, 
+        selected_tables: list[str],
+        table_blocks: Optional[Dict[str, TableBlock]]=None,
+        output_dir: Optional[Path]=None
+    ) -> Optional[Path]:
+        '''
+        table_blocks: Block index of the script, if already known. Otherwise the script is scanned.\n
+        output_dir: Directory of the filtered script. Defaults to the directory of the script.
+        '''
+        if table_blocks is None:
+            table_blocks = self.index_table_blocks(script_path, selected_tables)
+        filtered_script_path = (output_dir or script_path.parent) / f"filtered_{script_path.name}"
 
-        if filtered_script:
-            filtered_script_path = script_path.parent / f"filtered_{script_path.name}"
-            with open(filtered_script_path, 'w') as f:
-                f.write(filtered_script)
+        if self.write_filtered_script(script_path, table_blocks, selected_tables, filtered_script_path):
             self.logger.info(f"Filtered script created: {filtered_script_path}")
             return filtered_script_path
 
-    def generate_table_blocks(self, script_path: Path)-> dict[str, str]:
+    def index_table_blocks(self, script_path: Path, selected_tables: Optional[list[str]]=None) -> Dict[str, TableBlock]:
+        '''
+        Stream through the SQL script once and return a dictionary of table names
+        mapping to the byte offset and length of their SQL blocks.
+        If selected_tables is given, only those tables are kept and reading stops
+        as soon as all of them have been found.
+        '''
+        indexer = index_script(script_path, selected_tables)
+        self.logger.debug(f"Indexed {len(indexer.blocks)} table block(s) in {indexer.bytes_indexed} bytes of {script_path}.")
+        return indexer.blocks
+
+    def generate_table_blocks(self, script_path: Path, selected_tables: Optional[list[str]]=None) -> dict[str, str]:
         '''
         Parse the SQL script and return a dictionary of 
         table names mapping to its corresponding SQL blocks.
         '''
-        with open(script_path, 'r') as f:
-            lines = f.readlines()
-
-        table_blocks = {}
-        current_table = None
-        current_block = []
-
-        for line in lines:
-            line_strip = line.strip()
-            
-            # Detect the start of a table block
-            if line_strip.startswith("print ('Syncing"):
-                current_table = line_strip.split()[2]  # Extract table name: [print, ('Syncing, [TableName],...]
-                current_block = [line]
-            
-            # Accumulate lines in the current block
-            elif current_table:
-                current_block.append(line)
-                # Detect the end of the table block
-                if line_strip.startswith("print ('") and "synchronized" in line_strip:
-                    table_blocks[current_table] = "".join(current_block)
-                    current_table = None
-                    current_block = []
-        
-        return table_blocks
+        table_blocks = self.index_table_blocks(script_path, selected_tables)
+        with open(script_path, 'rb') as f:
+            return {
+                table: read_block(f, block).decode("utf-8", errors="replace")
+                for table, block in table_blocks.items()
+            }
 
     def generate_filtered_script(self, table_blocks, selected_tables: list[str]) -> Optional[str]:
         '''
         Generate a new SQL script containing only the selected tables.
         '''
         try:
-            new_script = "set nocount on\n"
-            new_script += "declare @xmls nvarchar(max)\n\n"
+            new_script = FILTERED_SCRIPT_HEADER
 
             for table in selected_tables:
                 if table in table_blocks:
@@ -127,24 +93,74 @@ class ScriptParser:
                 else:
                     raise RuntimeError(f"Table '{table}' not found in the script.")
 
-            new_script += "set nocount off\n"
+            new_script += FILTERED_SCRIPT_FOOTER
 
             return new_script
         
         except Exception as e:
             self.logger.error(f"An error occurred while generating filtered script: {e}")
             return None
+
+    def write_filtered_script(
+        self, 
+        script_path: Path, 
+        table_blocks: Dict[str, TableBlock], 
+        selected_tables: list[str], 
+        output_path: Path
+    ) -> bool:
+        '''
+        Write a new SQL script containing only the selected tables,
+        copying each block straight from its offset in the source script.
+        '''
+        try:
+            missing = [table for table in selected_tables if table not in table_blocks]
+            if missing:
+                raise RuntimeError(f"Table(s) {missing} not found in the script.")
+
+            with open(script_path, 'rb') as src, open(output_path, 'wb') as dst:
+                dst.write(FILTERED_SCRIPT_HEADER.encode())
+                for table in selected_tables:
+                    self.logger.debug(f"Including table '{table}' in the new script.")
+                    copy_block(src, dst, table_blocks[table])
+                    dst.write(b"\n")
+                dst.write(FILTERED_SCRIPT_FOOTER.encode())
+
+            return True
+
+        except Exception as e:
+            self.logger.error(f"An error occurred while generating filtered script: {e}")
+            return False
         
 class ScriptExecutor:
-    def __init__(self, connection_config: Dict, logger: Optional[logging.Logger]=None):
+    def __init__(
+        self, 
+        connection_config: Dict, 
+        logger: Optional[logging.Logger]=None,
+        table_parallelism: int=1,
+        driver=None,
+        pool: Optional[ConnectionPool]=None,
+        scheduler: Optional[DatabaseScheduler]=None
+    ):
+        '''
+        table_parallelism: Number of connections per database used to run table blocks in parallel.
+        1 executes the whole script as a single batch.\n
+        driver: DB-API module used to connect. Defaults to pyodbc. Ignored if pool is given.\n
+        pool: Connection pool shared across runs and databases. A private pool is created if omitted.\n
+        scheduler: Schedules execution across databases. Defaults to at most 4 databases at a time.
+        '''
         self.db_connection = connection_config
         self.logger = logger or module_logger
+        self.table_parallelism = max(1, table_parallelism)
+        self.pool = pool or ConnectionPool(driver or pyodbc, logger=self.logger)
+        self.driver = self.pool.driver
+        self.scheduler = scheduler or DatabaseScheduler(logger=self.logger)
+        self.database_runs: List[DatabaseRun] = [] # Per-database timings of the last execute()
+        self.prevalidation_cancelled = threading.Event()
+        self.prevalidation_cursors = set() # Cursors of the running prevalidation checks, to cancel them
+        self.prevalidation_lock = threading.Lock()
     
     def create_connection_string(self, config) -> str:
-        parts = []
-        for key, value in config.items():
-            parts.append(f"{key}={value}")
-        return 'driver={SQL Server};' + ';'.join(parts) + ';'
+        return self.pool.connection_string(config)
 
     def write_execution_log(self, log_dir: Path, messages: list[str]):
         log_dir.mkdir(parents=True, exist_ok=True)
@@ -153,70 +169,227 @@ class ScriptExecutor:
             log_file.write("\n".join(messages) + "\n")
         self.logger.info(f"Execution log written to: {execution_log}")
 
+    def collect_messages(self, cursor) -> list[str]:
+        messages = []
+        if cursor.messages:
+            for message in cursor.messages:
+                messages.append(message[1])
+        while cursor.nextset():
+            if cursor.messages:
+                for message in cursor.messages:
+                    messages.append(message[1])
+        return messages
+
+    def execute_batch(self, sql_script: str, connection_config: Dict) -> list[str]:
+        '''Execute a batch in its own transaction on a pooled connection and return the server messages.'''
+        with self.pool.connection(connection_config) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql_script)
+                messages = self.collect_messages(cursor)
+                conn.commit()
+                return messages
+            finally:
+                cursor.close()
+
+    def prevalidate_on_database(self, sql_script: str, connection_config: Dict, mode: str="parseonly"):
+        '''
+        Parse ("parseonly") or compile ("noexec") the script on the database without running it.
+        Raises on errors. The pooled connection is kept warm for the execution.
+        Does nothing once cancel_prevalidation() has been called.
+        '''
+        if mode not in PREVALIDATION_OPTIONS:
+            raise ValueError(f"Invalid prevalidate_script option: {mode}")
+        if self.prevalidation_cancelled.is_set():
+            return
+        option = PREVALIDATION_OPTIONS[mode]
+        with tracer.span(f"prevalidate:{connection_config['database']}", mode=mode), \
+                self.pool.connection(connection_config) as conn:
+            cursor = conn.cursor()
+            with self.prevalidation_lock:
+                self.prevalidation_cursors.add(cursor)
+            try:
+                if self.prevalidation_cancelled.is_set(): # Cancelled before the cursor could be
+                    return
+                cursor.execute(f"SET {option} ON")
+                try:
+                    cursor.execute(sql_script)
+                    while cursor.nextset():
+                        pass
+                finally:
+                    cursor.execute(f"SET {option} OFF")
+                conn.rollback()
+            finally:
+                with self.prevalidation_lock:
+                    self.prevalidation_cursors.discard(cursor)
+                cursor.close()
+
+    def cancel_prevalidation(self):
+        '''Cancel the running prevalidation checks and skip those not started yet.'''
+        self.prevalidation_cancelled.set()
+        with self.prevalidation_lock:
+            cursors = list(self.prevalidation_cursors)
+        for cursor in cursors:
+            try:
+                cursor.cancel()
+            except Exception as e:
+                self.logger.debug(f"Cannot cancel a prevalidation check: {e}")
+
     def execute_on_database(self, sql_script: str, connection_config: Dict, log_dir: Path):
         database = connection_config["database"]
-        connection_string = self.create_connection_string(connection_config)
 
         try:
-            with pyodbc.connect(connection_string, autocommit=False) as conn:
-                with conn.cursor() as cursor:    
-                    self.logger.info(f"Executing SQL script on {database}.")
-                    cursor.execute(sql_script)
-
-                    messages = []
-                    messages.append(f"Database: {database}")
-                    if cursor.messages:
-                        for message in cursor.messages:
-                            messages.append(message[1])
-                    while cursor.nextset():
-                        if cursor.messages:
-                            for message in cursor.messages:
-                                messages.append(message[1])
-
-                    conn.commit()
-                    self.write_execution_log(log_dir, messages)
-                    self.logger.info(f"Completed execution on {database}.")
+            self.logger.info(f"Executing SQL script on {database}.")
+            messages = [f"Database: {database}"]
+            with tracer.span(f"execute:{database}", bytes=len(sql_script)) as span:
+                messages.extend(self.execute_batch(sql_script, connection_config))
+                span.set(messages=len(messages) - 1)
+
+            self.write_execution_log(log_dir, messages)
+            self.logger.info(f"Completed execution on {database}.")
         
-        except pyodbc.Error as e:
+        except self.driver.Error as e:
             self.logger.error(f"Database error on {database}: {e}")
             raise  # Re-raise so execute() can catch it
         except Exception as e:
             self.logger.error(f"Unexpected error on {database}: {e}")
             raise
 
-    def execute(self, script_path: Path, databases: Optional[List[str]]=None) -> bool:
+    def split_script(self, script_path: Path) -> Tuple[str, List[Tuple[Optional[str], str]]]:
+        '''
+        Split a script into its declarations (the "declare" and session "set" option lines
+        before the first table block) and its segments in script order, as (table, sql) pairs. table is None for SQL outside
+        the table blocks (the prologue, statements between blocks and the footer), which is run
+        serially. Blank residue between blocks is dropped.
+        '''
+        indexer = index_script(script_path)
+        blocks = sorted(indexer.blocks.values(), key=lambda block: block.offset)
+
+        segments: List[Tuple[Optional[str], str]] = []
+        with open(script_path, 'rb') as f:
+            position = 0
+            for block in blocks + [None]:
+                residue_end = block.offset if block else script_path.stat().st_size
+                f.seek(position)
+                residue = f.read(residue_end - position).decode("utf-8", errors="replace")
+                if residue.strip():
+                    segments.append((None, residue))
+                if block:
+                    segments.append((block.table, read_block(f, block).decode("utf-8", errors="replace")))
+                    position = block.offset + block.length
+
+            f.seek(0)
+            prologue = f.read(indexer.prologue_length or 0).decode("utf-8", errors="replace")
+        return script_declarations(prologue), segments
+
+    def execute_blocks_on_database(
+        self, 
+        declarations: str, 
+        segments: List[Tuple[Optional[str], str]], 
+        connection_config: Dict, 
+        log_dir: Path
+    ):
+        '''
+        Execute the segments of split_script() in order, each in its own transaction. Consecutive
+        table blocks run in parallel on a bounded pool of connections to the database, while SQL
+        outside the blocks runs alone between them. The declarations are prepended to every segment
+        but the prologue, which holds them already. Execution stops after the first failing segment
+        or group of blocks. Messages are written to the execution log in script order.
+        '''
+        database = connection_config["database"]
+        tables = sum(1 for table, _ in segments if table is not None)
+        max_workers = min(self.table_parallelism, tables) or 1
+        self.logger.info(f"Executing {tables} table block(s) on {database} with {max_workers} connection(s).")
+
+        # Groups of segment indexes run together: a serial segment alone, or consecutive table blocks
+        groups: List[List[int]] = []
+        for i, (table, _) in enumerate(segments):
+            if table is not None and groups and segments[groups[-1][-1]][0] is not None:
+                groups[-1].append(i)
+            else:
+                groups.append([i])
+
+        def batch(i: int) -> str:
+            sql = segments[i][1]
+            return sql if i == 0 and segments[i][0] is None else declarations + sql
+
+        results: List[List[str]] = [[] for _ in segments]
+        errors = []
+        parent_thread_name = threading.current_thread().name
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{parent_thread_name}-tableworker") as executor, \
+                tracer.span(f"execute:{database}", tables=tables) as span:
+            for group_number, group in enumerate(groups):
+                futures = {executor.submit(self.execute_batch, batch(i), connection_config): i for i in group}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    label = f"Table '{segments[i][0]}'" if segments[i][0] is not None else f"SQL outside the table blocks (segment {i})"
+                    try:
+                        results[i] = future.result()
+                        self.logger.debug(f"{label} completed on {database}.")
+                    except Exception as e:
+                        self.logger.error(f"{label} failed on {database}: {e}")
+                        results[i] = [f"{label} failed: {e}"]
+                        errors.append(segments[i][0] or f"segment {i}")
+                if errors:
+                    skipped = sum(len(g) for g in groups[group_number + 1:])
+                    if skipped:
+                        self.logger.error(f"Skipping the {skipped} remaining segment(s) on {database}.")
+                    break
+            span.set(failed_tables=len(errors))
+
+        messages = [f"Database: {database}"]
+        for segment_messages in results:
+            messages.extend(segment_messages)
+        self.write_execution_log(log_dir, messages)
+
+        if errors:
+            raise Exception(f"Failed on {len(errors)} segment(s) on {database}: {errors}")
+        self.logger.info(f"Completed execution on {database}.")
+
+    def execute(
+        self,
+        script_path: Path,
+        databases: Optional[List[str]]=None,
+        log_dir: Optional[Path]=None,
+        connection_configs: Optional[List[Dict]]=None
+    ) -> bool:
+        '''
+        databases: Databases on the server of connection_config to run the script on.
+        If neither they nor connection_configs are given, the database of connection_config is used.\n
+        connection_configs: Full connection configs, possibly on different servers, used instead of databases.
+        '''
         try:
             if not script_path.exists():
                 raise FileNotFoundError(f"Script file not found: {script_path}")
             self.logger.info(f"SQL script to be executed: {script_path}")
 
-            sql_script = script_path.read_text()
-            log_dir = script_path.parent
-
-            if databases:
-                parent_thread_name = threading.current_thread().name
-                with ThreadPoolExecutor(max_workers=len(databases), thread_name_prefix=f"{parent_thread_name}-dbworker") as executor:
-                    futures = {}
-                    for database in databases:
-                        cloned_config = self.db_connection.copy()
-                        cloned_config["database"] = database
-                        future = executor.submit(self.execute_on_database, sql_script, cloned_config, log_dir)
-                        futures[future] = database
-
-                    errors = []
-                    for future in as_completed(futures):
-                        database = futures[future]
-                        try:
-                            future.result() # raise exceptions if any
-                        except Exception as e:
-                            self.logger.error(f"Failed on {database}: {e}")
-                            errors.append((database, e))
-
-                    if errors:
-                        error_summary = ", ".join([f"{db}: {str(e)}" for db, e in errors])
-                        raise Exception(f"Failed on {len(errors)} database(s): {error_summary}")
+            log_dir = log_dir or script_path.parent
+            declarations, segments = "", []
+            if self.table_parallelism > 1:
+                declarations, segments = self.split_script(script_path)
+                if not any(table is not None for table, _ in segments):
+                    self.logger.warning("No table blocks found in the script. Executing it as a single batch.")
+                    segments = []
+            if segments:
+                run_on_database = partial(self.execute_blocks_on_database, declarations, segments, log_dir=log_dir)
+            else:
+                sql_script = script_path.read_text()
+                run_on_database = partial(self.execute_on_database, sql_script, log_dir=log_dir)
+
+            if connection_configs or databases:
+                connection_configs = connection_configs or [{**self.db_connection, "database": database} for database in databases] # type: ignore
+                self.database_runs = self.scheduler.run(connection_configs, run_on_database)
+
+                errors = [(run.database, run.error) for run in self.database_runs if run.error]
+                skipped = [run.database for run in self.database_runs if run.skipped]
+                for database, e in errors:
+                    self.logger.error(f"Failed on {database}: {e}")
+
+                if errors or skipped:
+                    error_summary = ", ".join([f"{db}: {str(e)}" for db, e in errors])
+                    raise Exception(f"Failed on {len(errors)} database(s): {error_summary}. Skipped: {skipped}")
             else:
-                self.execute_on_database(sql_script, self.db_connection, log_dir)
+                run_on_database(self.db_connection)
             
             return True
                         
@@ -224,31 +397,88 @@ class ScriptExecutor:
             self.logger.error(f"An error occurred during SQL execution: {e}")
             return False
 
+        finally:
+            self.logger.debug(f"Connection pool stats: {self.pool.stats()}")
+
 class SQLDeploymentPipeline:
     def __init__(
         self, 
         config: Dict, 
         db_connection: Dict,
         log_directory: Optional[Path] = None, 
-        custom_logger: Optional[logging.Logger] = None
+        custom_logger: Optional[logging.Logger] = None,
+        journal: Optional[RunJournal] = None
     ):
         '''
         config: Configuration dictionary.\n
         log_directory: Directory to store downloaded script, processed scripts, and SQL server execution log.\n
-        custom_logger: Optional custom logger for logging. The log file may or may not be in log_directory.
+        custom_logger: Optional custom logger for logging. The log file may or may not be in log_directory.\n
+        journal: Journal of the deployment run. The executed script and the databases it succeeded on are
+        recorded, and if it already holds them, only the databases that failed are executed again.
         '''
         self.validate_config(config)
         self.config = config
 
         self.validate_db_connection(db_connection)
         self.db_connection = db_connection
+        self.targets = load_targets(config.get("targets", []), db_connection) # Fan-out inventory, if any
 
         self.log_directory = log_directory or Path(config.get("log_dir", "./logs/update_schema"))
         self.logger = custom_logger or module_logger
-
-        self.downloader = ScriptDownloader(self.logger)
+        self.journal = journal
+
+        self.script_cache = None
+        cache_dir = config.get("script_cache_dir", "./logs/script_cache")
+        if cache_dir:
+            self.script_cache = ScriptCache(
+                Path(cache_dir),
+                max_size_mb=config.get("script_cache_max_size_mb", 2048),
+                max_age_days=config.get("script_cache_max_age_days", 30),
+                logger=self.logger
+            )
+        self.table_blocks: Optional[Dict[str, TableBlock]] = None # Block index of the downloaded script, if known
+
+        self.applied_state = None
+        if config.get("changed_tables_only", False):
+            self.applied_state = AppliedTableState(
+                Path(config.get("applied_state_path", "./logs/applied_tables.json")),
+                logger=self.logger
+            )
+        self.applied_tables: List[str] = [] # Tables in the script that is about to be executed
+
+        self.downloader = AsyncScriptDownloader(
+            self.logger,
+            ready_timeout=config.get("web_app_ready_timeout_seconds", 600),
+            progress_callback=self.log_download_progress
+        )
+        self.last_progress_logged = 0
         self.parser = ScriptParser(self.logger)
-        self.executor = ScriptExecutor(db_connection, self.logger)
+        self.connection_pool = ConnectionPool(
+            pyodbc,
+            max_per_server=config.get("max_connections_per_server", 8),
+            logger=self.logger,
+            server_limits={target.server: target.max_connections for target in self.targets if target.max_connections}
+        )
+        self.executor = ScriptExecutor(
+            db_connection, 
+            self.logger, 
+            table_parallelism=config.get("table_parallelism", 1),
+            pool=self.connection_pool,
+            scheduler=DatabaseScheduler(
+                max_per_server=config.get("max_concurrent_databases", 4),
+                canary_databases=config.get("canary_databases", []) + [
+                    target_key(connection_config)
+                    for target in self.targets if target.canary
+                    for connection_config in target.connection_configs()
+                ],
+                history_path=Path(config.get("database_history_path", "./logs/database_durations.json")),
+                logger=self.logger,
+                server_limits={
+                    target.server: target.max_concurrent_databases
+                    for target in self.targets if target.max_concurrent_databases
+                }
+            )
+        )
 
     def validate_config(self, config: Dict):
         required_keys = ["url", "update_all_tables", "tables", "validate_script_before_execution"]
@@ -262,20 +492,77 @@ class SQLDeploymentPipeline:
         if missing:
             raise ValueError(f"Missing required config keys: {missing}")
 
+    def log_download_progress(self, written: int, total: Optional[int], bytes_per_second: float):
+        if written - self.last_progress_logged < DOWNLOAD_PROGRESS_INTERVAL and written != total:
+            return
+        self.last_progress_logged = written
+        of_total = f" of {total / 1024 / 1024:.1f}" if total else ""
+        self.logger.info(f"Downloaded {written / 1024 / 1024:.1f}{of_total} MB ({bytes_per_second / 1024 / 1024:.1f} MB/s)")
+
     def download_script(self) -> Path:
-        """Downloads the SQL script using ScriptDownloader."""
+        """Downloads the SQL script using AsyncScriptDownloader."""
         url = self.config.get("url", "")
         download_dir = self.log_directory
 
-        script_path = self.downloader.download_script(url, download_dir)
-        if not script_path:
+        downloaded = asyncio.run(self.downloader.download_script(url, download_dir))
+        self.logger.debug(f"Download timings: {self.downloader.timings.get(url)}")
+        if not downloaded:
             self.logger.error("Failed to download the script.") 
             raise Exception("Script download failed.")
+
+        script_path, self.table_blocks = downloaded.path, downloaded.table_blocks
+        if self.script_cache:
+            script_path, self.table_blocks = self.script_cache.add(
+                script_path, downloaded.content_hash, downloaded.table_blocks
+            )
         
         return script_path
 
-    def parse_script(self, script_path: Path) -> Path:
-        """Parses the SQL script using ScriptParser."""
+    def connection_configs(self) -> List[Dict]:
+        """Every database the script runs on: the targets' databases if there are targets, else databases on the .env server."""
+        if self.targets:
+            return [config for target in self.targets for config in target.connection_configs()]
+        databases = self.config.get("databases", [])
+        return [{**self.db_connection, "database": database} for database in databases] or [self.db_connection]
+
+    def uses_scheduler(self) -> bool:
+        return bool(self.targets or self.config.get("databases", []))
+
+    def target_keys(self) -> List[str]:
+        return [target_key(config) for config in self.connection_configs()]
+
+    def report_targets(self, results: Dict[str, Dict]):
+        if not self.targets:
+            return
+        matrix_path = write_result_matrix(result_matrix(self.targets, results), self.log_directory, self.logger)
+        self.logger.info(f"Target results written to: {matrix_path}")
+
+    def select_changed_tables(self, script_path: Path) -> List[str]:
+        """Returns the tables whose block differs from the one last applied to any target database."""
+        if not self.table_blocks or any(block.hash is None for block in self.table_blocks.values()):
+            self.table_blocks = index_script(script_path, hash_blocks=True).blocks
+
+        changed_tables = self.applied_state.changed_tables(self.target_keys(), self.table_blocks) # type: ignore
+        self.logger.info(f"{len(changed_tables)} of {len(self.table_blocks)} table(s) changed since the last applied script: {changed_tables}")
+        return changed_tables
+
+    def parse_script(self, script_path: Path) -> Optional[Path]:
+        """Parses the SQL script using ScriptParser. Returns None if there is nothing to execute."""
+        if self.applied_state:
+            selected_tables = self.select_changed_tables(script_path)
+            if not selected_tables:
+                return None
+            self.applied_tables = selected_tables
+
+            filtered_script_path = self.parser.parse_script(
+                script_path, selected_tables, table_blocks=self.table_blocks, output_dir=self.log_directory
+            )
+            if not filtered_script_path:
+                self.logger.error("Failed to parse the script.")
+                raise Exception("Script parsing failed.")
+
+            return filtered_script_path
+
         update_all_tables = self.config.get("update_all_tables", False)
         if update_all_tables:
             self.logger.info("Updating all tables as per configuration. No parsing needed.")
@@ -284,78 +571,294 @@ class SQLDeploymentPipeline:
         selected_tables = self.config.get("tables", [])
         self.logger.info(f"Parsing selected tables: {selected_tables}")
         
-        filtered_script_path = self.parser.parse_script(script_path, selected_tables)
+        filtered_script_path = self.parser.parse_script(
+            script_path, selected_tables, table_blocks=self.table_blocks, output_dir=self.log_directory
+        )
         if not filtered_script_path:
             self.logger.error("Failed to parse the script.")
             raise Exception("Script parsing failed.")
         
         return filtered_script_path
 
-    def open_validation_panel(self, port, sql_script_path):
-         # Resolve path of validation_console.py relative to this module
-        module_dir = Path(__file__).parent
-        console_script = module_dir / "validation_console.py"
-
-        if not console_script.exists():
-            raise Exception(f"Cannot find {console_script}")
-
-        subprocess.Popen(
-            ["python", str(console_script), str(port), str(sql_script_path)],
-            creationflags=subprocess.CREATE_NEW_CONSOLE
-        )
+    def prevalidate_script(self, script_path: Path, mode: str) -> Dict[str, Exception]:
+        """
+        Checks the script on every target database without running it, which also leaves
+        a warm pooled connection to each. Returns the errors by "server/database".
+        """
+        connection_configs = self.connection_configs()
+        if not connection_configs:
+            return {}
+        sql_script = script_path.read_text()
+        errors = {}
+        with ThreadPoolExecutor(max_workers=min(32, len(connection_configs)), thread_name_prefix="prevalidate") as executor:
+            futures = {
+                executor.submit(tracer.wrap(self.executor.prevalidate_on_database), sql_script, config, mode): target_key(config)
+                for config in connection_configs
+            }
+            for future in as_completed(futures):
+                error = future.exception()
+                if self.executor.prevalidation_cancelled.is_set():
+                    continue
+                if error:
+                    self.logger.error(f"Script failed the {mode} check on {futures[future]}: {error}")
+                    errors[futures[future]] = error
+        if self.executor.prevalidation_cancelled.is_set():
+            self.logger.info(f"Script {mode} check cancelled.")
+            return {}
+        self.logger.info(f"Script {mode} check done on {len(connection_configs)} database(s), {len(errors)} failed.")
+        return errors
 
     def validate_script(self, script_path: Path) -> bool:
-        validate_script = self.config.get("validate_script_before_execution", True)
+        """
+        Asks for approval through the validation_gate. Meanwhile, if prevalidate_script is
+        set, the script is checked on every target database. The check is only waited for
+        once the script is approved, and is cancelled otherwise.
+        Returns False if the script was rejected. Raises if there was no answer within
+        validation_timeout_seconds or the script failed the check.
+        """
+        if not self.config.get("validate_script_before_execution", True):
+            return True
 
-        if validate_script:
-            host, port = "127.0.0.1", 50505
+        gate = create_approval_gate(self.config.get("validation_gate", "console"), self.logger)
+        timeout = self.config.get("validation_timeout_seconds")
+        mode = self.config.get("prevalidate_script")
+        self.executor.prevalidation_cancelled.clear()
+        background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prevalidation")
+        prevalidation = background.submit(tracer.wrap(self.prevalidate_script), script_path, mode) if mode else None
+        approved = None
+        try:
+            try:
+                gate.request(script_path)
+                self.logger.info("Waiting for user response after script validation...")
+                approved = gate.wait(timeout)
+            finally:
+                gate.close()
+            errors = prevalidation.result() if prevalidation and approved else {}
+        finally:
+            if not approved:
+                self.executor.cancel_prevalidation() # Rejected, timed out or failed: do not wait for the check
+            background.shutdown(wait=False)
+
+        if approved is None:
+            raise TimeoutError(f"No answer to the script validation within {timeout}s.")
+        if not approved:
+            self.logger.warning("Operation aborted by user.")
+            return False
+        if errors:
+            raise Exception(f"Script failed the {mode} check on {len(errors)} database(s): {sorted(errors)}")
 
-            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            server.bind((host, port))
-            server.listen(1)
+        self.logger.info("Script acknowledged by user. Proceed with execution.")
+        return True
 
-            logging.info("Waiting for user response after script validation...")
-            self.open_validation_panel(port, script_path)
+    def resumable_script(self) -> Optional[Path]:
+        """Returns the script the journal says was being executed, if it is still there unchanged."""
+        checkpoint = self.journal.sql_checkpoint() if self.journal else None
+        if not checkpoint:
+            return None
+        script_path = Path(checkpoint["script"])
+        if not script_path.exists() or hash_file(script_path) != checkpoint["sha256"]:
+            self.logger.warning(f"Script {script_path} of the previous attempt is missing or changed. Starting the SQL deployment over.")
+            return None
+        return script_path
 
-            conn, _ = server.accept()
-            response = conn.recv(1024).decode()
-            conn.close()
-            server.close()
+    def record_database_results(self, is_success: bool):
+        if not self.journal:
+            return
+        if self.uses_scheduler():
+            results = {f"{run.server}/{run.database}": run.error is None and not run.skipped for run in self.executor.database_runs}
+        else:
+            results = {target_key(self.db_connection): is_success}
+        self.journal.record_databases(results)
+
+    def execute_script(self, script_path: Path, resumed: bool=False):
+        """
+        Executes the SQL script using ScriptExecutor.
+        resumed: The script was executed by a previous attempt, only run it on the databases that did not succeed.
+        """
+        connection_configs = self.connection_configs()
+        if resumed:
+            succeeded = self.journal.succeeded_databases() # type: ignore
+            connection_configs = [config for config in connection_configs if target_key(config) not in succeeded]
+            self.logger.info(f"Already executed on {len(succeeded)} database(s), executing on the {len(connection_configs)} remaining.")
+            if self.applied_state:
+                self.table_blocks = index_script(script_path, hash_blocks=True).blocks
+                self.applied_tables = list(self.table_blocks)
+        elif self.journal:
+            self.journal.start_sql(script_path, hash_file(script_path))
+
+        if connection_configs:
+            if self.uses_scheduler():
+                is_success = self.executor.execute(script_path, log_dir=self.log_directory, connection_configs=connection_configs)
+            else:
+                is_success = self.executor.execute(script_path, log_dir=self.log_directory)
+            self.record_database_results(is_success)
+            self.report_targets(run_results(self.executor.database_runs))
+            if not is_success:
+                raise Exception("Script execution failed.")
+
+        if self.applied_state and self.table_blocks:
+            for target in self.target_keys():
+                self.applied_state.record(target, self.table_blocks, self.applied_tables)
+            self.logger.info(f"Recorded {len(self.applied_tables)} applied table(s) in {self.applied_state.state_path}")
+
+    def select_streamed_block(self, block: TableBlock) -> bool:
+        if self.applied_state:
+            return self.applied_state.is_changed(self.target_keys(), block)
+        if self.config.get("update_all_tables", False):
+            return True
+        return block.table in self.config.get("tables", [])
+
+    def split_streamed_databases(self, connection_configs: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Returns the databases streamed to while downloading, and the others. Only the scheduler's
+        first wave (the canaries, if any) is streamed to, at most as many databases per server as
+        both the scheduler and the connection pool allow. The others are executed through the
+        scheduler once the download is done, keeping its waves and per-server caps.
+        """
+        scheduler = self.executor.scheduler
+        first_wave = scheduler.plan(connection_configs)[0]
+        streamed: List[Dict] = []
+        per_server: Dict[str, int] = {}
+        for config in first_wave:
+            server = config["server"]
+            if per_server.get(server, 0) < min(scheduler.limit(server), self.connection_pool.limit(server)):
+                per_server[server] = per_server.get(server, 0) + 1
+                streamed.append(config)
+        return streamed, [config for config in connection_configs if config not in streamed]
+
+    def run_streaming(self):
+        """
+        Downloads the script and executes each table block as soon as it has arrived on the
+        first databases (see split_streamed_databases), then executes the filtered script on the rest.
+        With update_all_tables, the whole script is streamed, SQL outside the table blocks included,
+        and the filtered script is a copy of it.
+        """
+        url = self.config.get("url", "")
+        streamed_configs, remaining_configs = self.split_streamed_databases(self.connection_configs())
+        full_script = not self.applied_state and self.config.get("update_all_tables", False)
+        header, footer = ("", "") if full_script else (FILTERED_SCRIPT_HEADER, FILTERED_SCRIPT_FOOTER)
+
+        streamer = BlockStreamer(
+            self.executor,
+            streamed_configs,
+            prologue=header,
+            filtered_script_path=self.log_directory / "filtered_script.sql",
+            select=self.select_streamed_block,
+            queue_size=self.config.get("stream_queue_size", 8),
+            logger=self.logger,
+            full_script=full_script
+        )
+        self.log_directory.mkdir(parents=True, exist_ok=True)
+        streamer.start(header)
 
-            if response.strip().upper() != "Y":
-                self.logger.warning("Operation aborted by user.")
-                return False
+        self.logger.info(
+            f"Streaming SQL script to {len(streamed_configs)} database(s), "
+            f"then executing it on the {len(remaining_configs)} other(s)..."
+        )
+        downloaded = asyncio.run(self.downloader.download_script(
+            url, self.log_directory, on_block=streamer.on_block, on_segment=streamer.on_segment
+        ))
+        if not downloaded:
+            streamer.abort()
+            raise Exception("Script download failed.")
 
-            self.logger.info("Script acknowledged by user. Proceed with execution.")                
-            
-        return True
+        missing = []
+        if not self.applied_state and not self.config.get("update_all_tables", False):
+            missing = [table for table in self.config.get("tables", []) if table not in downloaded.table_blocks]
+        if missing:
+            streamer.abort(f"Table(s) {missing} not found in the script.") # Blocks still queued are not applied
+            raise Exception(f"Streaming execution failed: table(s) {missing} not found in the script")
+        streams = streamer.finish(footer, self.log_directory)
+
+        self.table_blocks = downloaded.table_blocks
+        if self.script_cache:
+            _, self.table_blocks = self.script_cache.add(downloaded.path, downloaded.content_hash, downloaded.table_blocks)
+        if self.journal:
+            self.journal.start_sql(streamer.filtered_script_path, hash_file(streamer.filtered_script_path))
+        self.logger.info(f"Streamed {len(streamer.selected_tables)} table block(s) to {len(streams)} database(s).")
+
+        results = {
+            target_key(stream.connection_config): {"status": "failed" if stream.error else "ok", "seconds": None, "error": str(stream.error) if stream.error else None}
+            for stream in streams
+        }
+        errors = [f"{stream.database}: {stream.error}" for stream in streams if stream.error]
+        self.executor.database_runs = []
+        if remaining_configs and errors:
+            self.logger.error(f"Streaming failed. Skipping the remaining {len(remaining_configs)} database(s).")
+        elif remaining_configs:
+            if not self.executor.execute(streamer.filtered_script_path, log_dir=self.log_directory, connection_configs=remaining_configs):
+                errors.append("execution of the filtered script failed")
+            results.update(run_results(self.executor.database_runs))
+
+        succeeded = [f"{run.server}/{run.database}" for run in self.executor.database_runs if run.error is None and not run.skipped]
+        if self.applied_state:
+            for stream in streams: # A failed stream has still committed the blocks before its failure
+                self.applied_state.record(target_key(stream.connection_config), self.table_blocks, stream.applied_tables)
+            for target in succeeded:
+                self.applied_state.record(target, self.table_blocks, streamer.selected_tables)
+        succeeded += [target_key(stream.connection_config) for stream in streams if stream.error is None]
+        if self.journal:
+            self.journal.record_databases({target: target in succeeded for target in self.target_keys()})
+        self.report_targets(results)
+        if errors:
+            raise Exception(f"Streaming execution failed: {', '.join(errors)}")
+
+    def run_stages(self):
+        script_path = self.resumable_script()
+        if script_path is not None:
+            self.logger.info(f"Resuming with the script executed by the previous attempt: {script_path}")
+            with tracer.span("execute", resumed=True):
+                self.execute_script(script_path, resumed=True)
+            self.logger.info("✅ SQL Deployment completed successfully.")
+            return
 
-    def execute_script(self, script_path: Path):
-        """Executes the SQL script using ScriptExecutor."""
-        databases = self.config.get("databases", [])
-        is_success = self.executor.execute(script_path, databases)
-        if not is_success:
-            raise Exception("Script execution failed.")
+        if self.config.get("streaming_execution", False):
+            if not self.config.get("validate_script_before_execution", True):
+                self.run_streaming()
+                self.logger.info("✅ SQL Deployment completed successfully.")
+                return
+            self.logger.info("Script validation is enabled, so the script is downloaded before execution.")
 
-    def run(self):
-        """Runs the full deployment pipeline."""
-        try:
-            self.logger.info("Downloading SQL script...")
-            script_path = self.download_script()
+        self.logger.info("Downloading SQL script...")
+        script_path = self.download_script()
 
-            self.logger.info("Parsing SQL script...")
+        self.logger.info("Parsing SQL script...")
+        with tracer.span("parse") as span:
             script_path = self.parse_script(script_path)
+            if script_path is not None:
+                span.set(bytes=script_path.stat().st_size)
+        if script_path is None:
+            self.logger.info("✅ No table changed since the last applied script. Nothing to execute.")
+            return
 
+        with tracer.span("validate"):
             if not self.validate_script(script_path):
-                sys.exit(0)
+                raise ScriptRejected("The SQL script was not approved for execution.")
 
-            self.logger.info("Executing SQL script...")
+        self.logger.info("Executing SQL script...")
+        with tracer.span("execute"):
             self.execute_script(script_path)
 
-            self.logger.info("✅ SQL Deployment completed successfully.")
+        self.logger.info("✅ SQL Deployment completed successfully.")
+
+    def run(self):
+        """Runs the full deployment pipeline."""
+        try:
+            with tracer.span("sql_deployment") as deployment_span:
+                self.run_stages()
+                deployment_span.set(connection_pool=self.connection_pool.stats())
+
+        except ScriptRejected as e:
+            self.logger.warning(f"SQL Deployment stopped: {e}")
+            raise
 
         except Exception as e:
             self.logger.exception(f"❌ SQL Deployment failed.")
-            sys.exit(1)
+            raise
+
+        finally:
+            self.connection_pool.close_all()
+            if self.script_cache:
+                self.script_cache.release()
 
         
\ No newline at end of file
@@ -0,0 +1,125 @@
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Set
+
+from .atomic_file import write_json_atomic
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+JOURNAL_NAME = "journal.json"
+
+
+def fingerprint_paths(paths: Iterable[Path], exclude: Iterable[Path]=()) -> Optional[str]:
+    '''
+    Fingerprint of every file under the paths (relative path, size and mtime), leaving out
+    the files in exclude. Returns None if a path does not exist.
+    '''
+    excluded = set(exclude)
+    hasher = hashlib.sha256()
+    for path in paths:
+        if not path.exists():
+            return None
+        hasher.update(str(path).encode())
+        if path.is_file():
+            stat = path.stat()
+            hasher.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                file_path = Path(root) / filename
+                if file_path in excluded:
+                    continue
+                stat = file_path.stat()
+                hasher.update(f"{file_path.relative_to(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return hasher.hexdigest()
+
+
+class RunJournal:
+    '''
+    Checkpoint journal of a deployment run, kept in its run directory so a failed run can
+    be resumed with deploy.py --resume <run_dir>.
+
+    Every task is recorded with its outcome and the fingerprint of its inputs and outputs
+    at that time. The SQL stage also records the script it executes and the
+    databases it succeeded on, so a resumed run re-executes only the failed ones.
+    Stored as JSON:
+    {"created": ..., "values": {...}, "tasks": {"name": {"status": ..., "fingerprint": ..., "finished": ...}},
+     "sql": {"script": ..., "sha256": ..., "databases": {"server/database": "succeeded" | "failed"}}}
+    '''
+    def __init__(self, run_dir: Path, logger: Optional[logging.Logger]=None):
+        self.journal_path = run_dir / JOURNAL_NAME
+        self.logger = logger or module_logger
+        self.lock = threading.Lock()
+        self.state: Dict[str, Any] = self.load()
+
+    def load(self) -> Dict[str, Any]:
+        state = {"created": datetime.now().isoformat(timespec="seconds"), "values": {}, "tasks": {}, "sql": None}
+        if not self.journal_path.exists():
+            return state
+        try:
+            with open(self.journal_path, 'r') as f:
+                return {**state, **json.load(f)}
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable run journal {self.journal_path}: {e}")
+            return state
+
+    def save(self):
+        write_json_atomic(self.journal_path, self.state)
+
+    def value(self, key: str, default: Any) -> Any:
+        '''Returns the value recorded under key, recording default first if there is none.'''
+        with self.lock:
+            if key not in self.state["values"]:
+                self.state["values"][key] = default
+                self.save()
+            return self.state["values"][key]
+
+    def record_task(self, name: str, status: str, fingerprint: Optional[str]=None):
+        with self.lock:
+            self.state["tasks"][name] = {
+                "status": status,
+                "fingerprint": fingerprint,
+                "finished": datetime.now().isoformat(timespec="seconds"),
+            }
+            self.save()
+
+    def attempted(self, name: str, status: str, fingerprint: Optional[str]) -> bool:
+        '''Whether the task ended with this status before, with the same, known fingerprint.'''
+        entry = self.state["tasks"].get(name)
+        return bool(entry) and entry["status"] == status and fingerprint is not None and entry["fingerprint"] == fingerprint
+
+    def start_sql(self, script_path: Path, script_hash: str):
+        '''Record the script about to be executed, keeping the database results if it is the same script.'''
+        with self.lock:
+            previous = self.state["sql"] or {}
+            databases = previous.get("databases", {}) if previous.get("sha256") == script_hash else {}
+            self.state["sql"] = {"script": str(script_path), "sha256": script_hash, "databases": databases}
+            self.save()
+
+    def record_databases(self, results: Dict[str, bool]):
+        '''Record whether the SQL script succeeded on each database ("server/database").'''
+        with self.lock:
+            databases = self.state["sql"]["databases"]
+            for target, succeeded in results.items():
+                databases[target] = "succeeded" if succeeded else "failed"
+            self.save()
+
+    def reset_sql(self):
+        with self.lock:
+            if self.state["sql"] is not None:
+                self.state["sql"] = None
+                self.save()
+
+    def sql_checkpoint(self) -> Optional[Dict[str, Any]]:
+        return self.state["sql"]
+
+    def succeeded_databases(self) -> Set[str]:
+        checkpoint = self.state["sql"] or {}
+        return {target for target, status in checkpoint.get("databases", {}).items() if status == "succeeded"}
@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from .atomic_file import write_json_atomic
+from .script_index import TableBlock, hash_file, index_script
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+STALE_PIN_SECONDS = 24 * 3600 # Pins left behind by a crashed run stop protecting their entry after this
+
+
+class ScriptCache:
+    '''
+    On-disk cache of downloaded schema sync scripts, keyed by content hash.
+
+    Every script is stored once as <hash>.sql next to a sidecar <hash>.index.json
+    mapping table name -> (offset, length, block hash), so a repeat filter over the
+    same script can seek straight to its blocks. The run directories holding the same
+    script share its file through a hardlink where possible, and are listed in a
+    <hash>.links file. Entries are evicted by age and by total size on disk, least
+    recently used first, together with the run copies they list. Entries pinned by a
+    running pipeline (a <hash>.<id>.pin file, removed by release()) are never evicted.
+    '''
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_size_mb: Optional[float]=None,
+        max_age_days: Optional[float]=None,
+        logger: Optional[logging.Logger]=None
+    ):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.max_age_seconds = max_age_days * 24 * 3600 if max_age_days else None
+        self.logger = logger or module_logger
+        self.pins: List[Path] = [] # Pin files of this instance, removed by release()
+
+    def script_path(self, content_hash: str) -> Path:
+        return self.cache_dir / f"{content_hash}.sql"
+
+    def index_path(self, content_hash: str) -> Path:
+        return self.cache_dir / f"{content_hash}.index.json"
+
+    def links_path(self, content_hash: str) -> Path:
+        return self.cache_dir / f"{content_hash}.links"
+
+    def add(
+        self, 
+        script_path: Path, 
+        content_hash: Optional[str]=None,
+        table_blocks: Optional[Dict[str, TableBlock]]=None
+    ) -> Tuple[Path, Dict[str, TableBlock]]:
+        '''
+        Store a downloaded script in the cache and return its path with its block index.
+        The script is hardlinked (or copied) into the cache. If the same content is already
+        cached, the run's copy is replaced by a hardlink to the cached file instead. Either
+        way the run's path is the one returned, and it is recorded so that evicting the
+        entry also removes it. The entry is pinned until release() is called.
+        If the same content is already cached, the existing index is reused. Otherwise the
+        given table_blocks (built while downloading) are stored, or the index is built.
+        '''
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        content_hash = content_hash or hash_file(script_path)
+        cached_path = self.script_path(content_hash)
+        self.pin(content_hash)
+
+        if cached_path.exists():
+            os.utime(cached_path) # Mark as recently used
+            self.share(cached_path, script_path)
+            self.logger.info(f"Script unchanged since a previous run, reusing its cached index: {cached_path}")
+        else:
+            self.store(script_path, cached_path)
+            self.logger.info(f"Script cached: {cached_path}")
+        self.record_link(content_hash, script_path)
+
+        cached_blocks = self.load_index(content_hash)
+        if cached_blocks is not None:
+            table_blocks = cached_blocks
+        elif table_blocks is not None:
+            self.save_index(content_hash, table_blocks)
+        else:
+            table_blocks = self.build_index(content_hash)
+
+        self.evict(keep=content_hash)
+        return script_path, table_blocks
+
+    def store(self, script_path: Path, cached_path: Path):
+        tmp_path = self.cache_dir / f"{cached_path.stem}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.link(script_path, tmp_path)
+        except OSError:
+            shutil.copyfile(script_path, tmp_path) # Other volume, or no hardlink support
+        os.replace(tmp_path, cached_path) # Concurrent runs storing the same script both succeed
+
+    def share(self, cached_path: Path, script_path: Path):
+        '''Replace the run's copy of a cached script by a hardlink to the cached file.'''
+        tmp_path = script_path.with_name(f"{script_path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            os.link(cached_path, tmp_path)
+        except OSError:
+            return # Other volume, or no hardlink support: keep the copy
+        os.replace(tmp_path, script_path)
+
+    def record_link(self, content_hash: str, script_path: Path):
+        with open(self.links_path(content_hash), 'a') as f:
+            f.write(f"{script_path.resolve()}\n")
+
+    def linked_paths(self, content_hash: str) -> List[Path]:
+        '''Run directory paths holding this entry's script, as recorded by add().'''
+        try:
+            with open(self.links_path(content_hash), 'r') as f:
+                return [Path(line) for line in f.read().splitlines() if line]
+        except FileNotFoundError:
+            return []
+
+    def entry_size(self, content_hash: str, cached_stat: os.stat_result) -> int:
+        '''Bytes on disk held by an entry: the cached file plus run copies that are not hardlinks of it.'''
+        size = cached_stat.st_size
+        for path in set(self.linked_paths(content_hash)):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if (stat.st_dev, stat.st_ino) != (cached_stat.st_dev, cached_stat.st_ino):
+                size += stat.st_size
+        return size
+
+    def pin(self, content_hash: str):
+        '''Protect an entry from eviction, by this or any other pipeline, until release().'''
+        pin_path = self.cache_dir / f"{content_hash}.{uuid.uuid4().hex}.pin"
+        pin_path.touch()
+        self.pins.append(pin_path)
+
+    def release(self):
+        '''Remove the pins of this instance.'''
+        for pin_path in self.pins:
+            pin_path.unlink(missing_ok=True)
+        self.pins = []
+
+    def pinned(self) -> Set[str]:
+        '''Hashes of the entries with a live pin. Stale pins are removed.'''
+        now = time.time()
+        hashes = set()
+        for pin_path in self.cache_dir.glob("*.pin"):
+            try:
+                if now - pin_path.stat().st_mtime > STALE_PIN_SECONDS:
+                    pin_path.unlink(missing_ok=True)
+                    continue
+            except FileNotFoundError:
+                continue
+            hashes.add(pin_path.name.split(".")[0])
+        return hashes
+
+    def load_index(self, content_hash: str) -> Optional[Dict[str, TableBlock]]:
+        '''Load the sidecar index. Returns None if it is missing or stale.'''
+        index_path = self.index_path(content_hash)
+        if not index_path.exists():
+            return None
+
+        try:
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+
+            if index.get("version") != INDEX_VERSION or index.get("hash") != content_hash:
+                raise ValueError("index was built by another version or for another script")
+            if index.get("size") != self.script_path(content_hash).stat().st_size:
+                raise ValueError("script size does not match the index")
+
+            return {
+                table: TableBlock(table, offset, length, block_hash)
+                for table, (offset, length, block_hash) in index["tables"].items()
+            }
+
+        except Exception as e:
+            self.logger.warning(f"Ignoring invalid script index {index_path}: {e}")
+            return None
+
+    def build_index(self, content_hash: str) -> Dict[str, TableBlock]:
+        script_path = self.script_path(content_hash)
+        indexer = index_script(script_path, hash_blocks=True)
+        self.save_index(content_hash, indexer.blocks)
+        self.logger.info(f"Indexed {len(indexer.blocks)} table block(s) of {script_path}.")
+        return indexer.blocks
+
+    def save_index(self, content_hash: str, table_blocks: Dict[str, TableBlock]):
+        index = {
+            "version": INDEX_VERSION,
+            "hash": content_hash,
+            "size": self.script_path(content_hash).stat().st_size,
+            "tables": {
+                table: [block.offset, block.length, block.hash]
+                for table, block in table_blocks.items()
+            },
+        }
+        write_json_atomic(self.index_path(content_hash), index, indent=None)
+
+    def evict(self, keep: Optional[str]=None):
+        '''
+        Remove entries older than max_age_days, then the least recently used
+        entries until the cache fits in max_size_mb, counting the run copies each entry
+        lists. Removing an entry also removes those run copies, so its disk space is
+        actually freed. The entry `keep` and pinned entries are never removed.
+        '''
+        if not self.cache_dir.exists():
+            return
+        pinned = self.pinned()
+
+        entries = []
+        for script in self.cache_dir.glob("*.sql"):
+            try:
+                stat = script.stat()
+            except FileNotFoundError:
+                continue # Evicted meanwhile by another pipeline
+            entries.append((stat.st_mtime, self.entry_size(script.stem, stat), script.stem))
+        entries.sort() # Oldest first
+
+        now = time.time()
+        total_size = sum(size for _, size, _ in entries)
+        for mtime, size, content_hash in entries:
+            if content_hash == keep or content_hash in pinned:
+                continue
+            expired = self.max_age_seconds is not None and now - mtime > self.max_age_seconds
+            oversized = self.max_size_bytes is not None and total_size > self.max_size_bytes
+            if not (expired or oversized):
+                continue
+
+            for path in self.linked_paths(content_hash):
+                path.unlink(missing_ok=True)
+            self.script_path(content_hash).unlink(missing_ok=True)
+            self.index_path(content_hash).unlink(missing_ok=True)
+            self.links_path(content_hash).unlink(missing_ok=True)
+            total_size -= size
+            self.logger.debug(f"Evicted cached script {content_hash}.")
@@ -0,0 +1,224 @@
+from dataclasses import dataclass
+import hashlib
+import re
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Optional
+
+# Markers of a table block in the schema sync script:
+#   print ('Syncing <Table> ...')
+#   ...
+#   print ('<Table> synchronized ...')
+PRINT_MARKER = b"print ('"
+BLOCK_START = b"print ('Syncing"
+BLOCK_END = b"synchronized"
+
+CHUNK_SIZE = 1024 * 1024
+
+DECLARATION_LINE = re.compile(r"\s*(?:declare\s|set\s+(?!@)\w+\s+(?:on|off)\b)", re.IGNORECASE) # Variable declarations and session options
+
+
+@dataclass
+class TableBlock:
+    table: str
+    offset: int
+    length: int
+    hash: Optional[str] = None # sha256 of the block bytes, if requested
+
+
+def extract_table_name(line: bytes) -> str:
+    '''
+    Extract the table name from a block start line: [print, ('Syncing, TableName, ...]
+    '''
+    return line.split()[2].decode("utf-8", errors="replace")
+
+
+def script_declarations(prologue: str) -> str:
+    '''The "declare" and session "set" option lines of a script prologue.'''
+    return "".join(line for line in prologue.splitlines(keepends=True) if DECLARATION_LINE.match(line))
+
+
+class TableBlockIndexer:
+    '''
+    Single-pass indexer that records the byte offset and length of every table block.
+
+    Bytes can be fed in chunks of any size (file reads, HTTP chunks, ...). Only the
+    incomplete last line is carried between chunks, so memory stays flat regardless
+    of the script size. If selected_tables is given, only those tables are recorded
+    and `done` turns True once all of them have been found.
+    If hash_blocks is True, a sha256 of every recorded block is computed on the fly.
+    If on_block is given, the bytes of every recorded block are captured and passed to
+    on_block(block, data) as soon as its closing line has been fed.
+    If on_segment is given, the bytes outside the table blocks (the prologue, statements
+    between blocks and the footer) are passed to on_segment(data) in script order: each
+    segment when the next block starts, and the last one on close().
+    '''
+    def __init__(
+        self, 
+        selected_tables: Optional[Iterable[str]]=None, 
+        hash_blocks: bool=False,
+        on_block: Optional[Callable[[TableBlock, bytes], None]]=None,
+        on_segment: Optional[Callable[[bytes], None]]=None
+    ):
+        self.selected = set(selected_tables) if selected_tables is not None else None
+        self.hash_blocks = hash_blocks
+        self.on_block = on_block
+        self.on_segment = on_segment
+        self.blocks: Dict[str, TableBlock] = {}
+        self.prologue_length: Optional[int] = None # Bytes before the first block
+        self.bytes_indexed = 0
+
+        self._pending = b"" # Incomplete last line of the previous chunk
+        self._current_table: Optional[str] = None
+        self._current_offset = 0
+        self._hasher = None # Hash of the open block, if it is being hashed
+        self._buffer: Optional[bytearray] = None # Bytes of the open block, if they are being captured
+        self._hash_from = 0 # Position in the current data the hasher/buffer has not consumed yet
+        self._segment: Optional[bytearray] = bytearray() if on_segment else None # Bytes outside the blocks since the last block
+        self._segment_from = 0 # Position in the current data the segment has not captured yet
+
+    @property
+    def done(self) -> bool:
+        return self.selected is not None and self.selected.issubset(self.blocks)
+
+    def feed(self, chunk: bytes):
+        data = self._pending + chunk if self._pending else chunk
+        last_newline = data.rfind(b"\n")
+        if last_newline == -1:
+            self._pending = data
+            return
+
+        complete = last_newline + 1
+        self._scan(data, complete)
+        self._pending = data[complete:]
+        self.bytes_indexed += complete
+
+    def close(self):
+        '''Flush the trailing line, which may not end with a newline.'''
+        if self._pending:
+            data = self._pending
+            self._pending = b""
+            self._scan(data, len(data))
+            self.bytes_indexed += len(data)
+        self._flush_segment()
+
+    def _scan(self, data: bytes, end: int):
+        # Only lines starting with "print ('" matter, so jump between occurrences
+        # instead of splitting every line.
+        pos = 0
+        while True:
+            index = data.find(PRINT_MARKER, pos, end)
+            if index == -1:
+                break
+
+            line_start = data.rfind(b"\n", 0, index) + 1
+            line_end = data.find(b"\n", index, end)
+            line_end = end if line_end == -1 else line_end + 1
+
+            if not data[line_start:index].strip():
+                self._process_line(data, line_start, line_end)
+            pos = line_end
+
+        # The open block, or the SQL outside the blocks, continues in the next chunk
+        self._consume(data, end)
+        self._hash_from = 0
+        if self._segment is not None and self._current_table is None:
+            self._segment += data[self._segment_from:end]
+        self._segment_from = 0
+
+    def _consume(self, data: bytes, end: int):
+        if self._hasher:
+            self._hasher.update(data[self._hash_from:end])
+        if self._buffer is not None:
+            self._buffer += data[self._hash_from:end]
+
+    def _process_line(self, data: bytes, line_start: int, line_end: int):
+        line = data[line_start:line_end].strip()
+        offset = self.bytes_indexed + line_start
+
+        # Detect the start of a table block
+        if line.startswith(BLOCK_START):
+            if self._segment is not None and self._current_table is None:
+                self._segment += data[self._segment_from:line_start]
+                self._flush_segment()
+            self._current_table = extract_table_name(line)
+            self._current_offset = offset
+            if self.prologue_length is None:
+                self.prologue_length = offset
+
+            self._hasher = None
+            self._buffer = None
+            if self._is_selected(self._current_table):
+                if self.hash_blocks:
+                    self._hasher = hashlib.sha256()
+                if self.on_block:
+                    self._buffer = bytearray()
+                self._hash_from = line_start
+
+        # Detect the end of the table block
+        elif self._current_table and BLOCK_END in line:
+            table = self._current_table
+            if self._is_selected(table):
+                length = offset + (line_end - line_start) - self._current_offset
+                self._consume(data, line_end)
+                block_hash = self._hasher.hexdigest() if self._hasher else None
+                block = TableBlock(table, self._current_offset, length, block_hash)
+                self.blocks[table] = block
+                if self._buffer is not None:
+                    self.on_block(block, bytes(self._buffer)) # type: ignore
+            self._current_table = None
+            self._hasher = None
+            self._buffer = None
+            self._segment_from = line_end
+
+    def _flush_segment(self):
+        if self._segment:
+            data = bytes(self._segment)
+            self._segment = bytearray()
+            self.on_segment(data) # type: ignore
+
+    def _is_selected(self, table: str) -> bool:
+        return self.selected is None or table in self.selected
+
+
+def index_script(
+    script_path: Path, 
+    selected_tables: Optional[Iterable[str]]=None, 
+    hash_blocks: bool=False
+) -> TableBlockIndexer:
+    '''
+    Index a script file in one pass. Stops reading as soon as all selected tables are found.
+    '''
+    indexer = TableBlockIndexer(selected_tables, hash_blocks)
+    with open(script_path, 'rb') as f:
+        while not indexer.done:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                indexer.close()
+                break
+            indexer.feed(chunk)
+    return indexer
+
+
+def hash_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def read_block(f: BinaryIO, block: TableBlock) -> bytes:
+    f.seek(block.offset)
+    return f.read(block.length)
+
+
+def copy_block(src: BinaryIO, dst: BinaryIO, block: TableBlock):
+    '''Copy a block between files in bounded chunks.'''
+    src.seek(block.offset)
+    remaining = block.length
+    while remaining > 0:
+        chunk = src.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise EOFError(f"Unexpected end of script while reading table '{block.table}'.")
+        dst.write(chunk)
+        remaining -= len(chunk)
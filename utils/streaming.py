@@ -0,0 +1,164 @@
+import logging
+import queue
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from .script_index import TableBlock, script_declarations
+from .tracing import tracer
+
+if TYPE_CHECKING:
+    from .pipeline import ScriptExecutor
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+END_OF_STREAM = None
+
+
+class DatabaseStream:
+    '''Consumer applying the streamed table blocks to one database, in arrival order.'''
+    def __init__(self, connection_config: Dict, queue_size: int):
+        self.connection_config = connection_config
+        self.database = connection_config["database"]
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.messages: List[str] = [f"Database: {self.database}"]
+        self.applied_tables: List[str] = []
+        self.error: Optional[Exception] = None
+        self.thread: Optional[threading.Thread] = None
+
+
+class BlockStreamer:
+    '''
+    Applies table blocks to several databases while the script is still downloading.
+
+    on_block() is called by the download thread for every completed block. Selected
+    blocks are appended to the filtered script and put on one bounded queue per
+    database. A worker per database executes them in order, each block in its own
+    transaction with the prologue prepended. A full queue blocks the download, so at
+    most queue_size blocks per database are held in memory. A database stops at its
+    first failing block and its remaining blocks are discarded.
+
+    With full_script, the whole script is applied instead: on_segment() receives the SQL
+    outside the blocks, which is queued and written in script order with the blocks.
+    The first segment is the script's own prologue. It runs as is, and its declarations
+    replace `prologue` for everything after it.
+    '''
+    def __init__(
+        self,
+        executor: "ScriptExecutor",
+        connection_configs: List[Dict],
+        prologue: str,
+        filtered_script_path: Path,
+        select: Optional[Callable[[TableBlock], bool]]=None,
+        queue_size: int=8,
+        logger: Optional[logging.Logger]=None,
+        full_script: bool=False
+    ):
+        '''
+        select: Decides whether a block is applied. Defaults to every block.\n
+        full_script: Also apply the SQL outside the blocks, and write the script unchanged.
+        '''
+        self.executor = executor
+        self.prologue = prologue
+        self.filtered_script_path = filtered_script_path
+        self.select = select or (lambda block: True)
+        self.full_script = full_script
+        self.logger = logger or module_logger
+        self.streams = [DatabaseStream(config, max(1, queue_size)) for config in connection_configs]
+        self.selected_tables: List[str] = []
+        self.streamed_segments = 0
+        self.script_file = None
+
+    def start(self, header: str):
+        self.script_file = open(self.filtered_script_path, 'wb')
+        self.script_file.write(header.encode())
+
+        parent_thread_name = threading.current_thread().name
+        for stream in self.streams:
+            stream.thread = threading.Thread(
+                target=tracer.wrap(self.consume),
+                args=(stream,),
+                name=f"{parent_thread_name}-stream-{stream.database}",
+                daemon=True
+            )
+            stream.thread.start()
+
+    def on_block(self, block: TableBlock, data: bytes):
+        if not self.select(block):
+            return
+
+        self.selected_tables.append(block.table)
+        self.script_file.write(data if self.full_script else data + b"\n") # type: ignore
+        self.logger.debug(f"Streaming table '{block.table}' to {len(self.streams)} database(s).")
+        self.put(block.table, self.prologue + data.decode("utf-8", errors="replace"))
+
+    def on_segment(self, data: bytes):
+        if not self.full_script:
+            return
+
+        self.script_file.write(data) # type: ignore
+        sql = data.decode("utf-8", errors="replace")
+        if not sql.strip():
+            return
+        if not self.selected_tables and not self.streamed_segments:
+            self.prologue = script_declarations(sql)
+        else:
+            sql = self.prologue + sql
+        self.streamed_segments += 1
+        self.logger.debug(f"Streaming SQL outside the table blocks to {len(self.streams)} database(s).")
+        self.put(None, sql)
+
+    def put(self, table: Optional[str], sql: str):
+        for stream in self.streams:
+            stream.queue.put((table, sql)) # Blocks while the database is behind
+
+    def consume(self, stream: DatabaseStream):
+        with tracer.span(f"database:{stream.database}") as span:
+            self.apply_blocks(stream)
+            span.set(tables=len(stream.applied_tables), messages=len(stream.messages) - 1)
+
+    def apply_blocks(self, stream: DatabaseStream):
+        while True:
+            item = stream.queue.get()
+            if item is END_OF_STREAM:
+                return
+            if stream.error is not None:
+                continue # Drain so the download is never blocked by a failed database
+
+            table, sql = item
+            label = f"Table '{table}'" if table else "SQL outside the table blocks"
+            try:
+                stream.messages.extend(self.executor.execute_batch(sql, stream.connection_config))
+                if table:
+                    stream.applied_tables.append(table)
+            except Exception as e:
+                self.logger.error(f"{label} failed on {stream.database}: {e}")
+                stream.messages.append(f"{label} failed: {e}")
+                stream.error = e
+
+    def finish(self, footer: str, log_dir: Path) -> List[DatabaseStream]:
+        '''Wait for every database to apply its remaining blocks and write the execution logs.'''
+        if self.script_file:
+            self.script_file.write(footer.encode())
+            self.script_file.close()
+
+        for stream in self.streams:
+            stream.queue.put(END_OF_STREAM)
+        for stream in self.streams:
+            if stream.thread:
+                stream.thread.join()
+            self.executor.write_execution_log(log_dir, stream.messages)
+        return self.streams
+
+    def abort(self, reason: str="Download failed."):
+        '''Stop the workers after a failed download, leaving queued blocks unapplied.'''
+        for stream in self.streams:
+            if stream.error is None:
+                stream.error = RuntimeError(reason)
+            stream.queue.put(END_OF_STREAM)
+        for stream in self.streams:
+            if stream.thread:
+                stream.thread.join()
+        if self.script_file:
+            self.script_file.close()
@@ -0,0 +1,123 @@
+from dataclasses import dataclass, field
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .applied_state import target_key
+from .db_scheduler import DatabaseRun
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Target:
+    '''
+    One SQL Server of the inventory and the databases to deploy to on it.
+
+    credentials: Prefix of the environment variables holding the login, read as
+    <credentials>_uid and <credentials>_pwd. If omitted, the uid and pwd of .env are used.
+    '''
+    name: str
+    server: str
+    databases: List[str]
+    credentials: Optional[str] = None
+    max_concurrent_databases: Optional[int] = None
+    max_connections: Optional[int] = None
+    canary: bool = False
+    login: Dict[str, str] = field(default_factory=dict)
+
+    def connection_configs(self) -> List[Dict]:
+        return [
+            {"server": self.server, "database": database, "uid": self.login["uid"], "pwd": self.login["pwd"]}
+            for database in self.databases
+        ]
+
+
+def load_targets(entries: List[Dict], db_connection: Dict) -> List[Target]:
+    '''
+    Build the targets of the "targets" config, resolving each one's credentials reference
+    from the environment. Raises ValueError on incomplete entries or missing credentials.
+    '''
+    targets = []
+    for entry in entries:
+        missing = [key for key in ("server", "databases") if not entry.get(key)]
+        if missing:
+            raise ValueError(f"Target {entry.get('name', entry)} is missing {missing}")
+
+        target = Target(
+            name=entry.get("name", entry["server"]),
+            server=entry["server"],
+            databases=list(entry["databases"]),
+            credentials=entry.get("credentials"),
+            max_concurrent_databases=entry.get("max_concurrent_databases"),
+            max_connections=entry.get("max_connections"),
+            canary=entry.get("canary", False),
+        )
+        if target.credentials:
+            variables = {key: f"{target.credentials}_{key}" for key in ("uid", "pwd")}
+            unset = [variable for variable in variables.values() if os.getenv(variable) is None]
+            if unset:
+                raise ValueError(f"Credentials of target {target.name} not found, set {unset} in .env")
+            target.login = {key: os.getenv(variable, "") for key, variable in variables.items()}
+        else:
+            target.login = {"uid": db_connection["uid"], "pwd": db_connection["pwd"]}
+        targets.append(target)
+
+    servers = [target.server for target in targets]
+    duplicates = sorted({server for server in servers if servers.count(server) > 1})
+    if duplicates:
+        raise ValueError(f"Server(s) {duplicates} appear in more than one target")
+    return targets
+
+
+def result_matrix(targets: List[Target], results: Dict[str, Dict]) -> List[Dict]:
+    '''
+    One row per target database, in inventory order. results maps "server/database" to
+    its outcome: status ("ok", "failed", "skipped" or "not run"), seconds and error.
+    '''
+    rows = []
+    for target in targets:
+        for config in target.connection_configs():
+            result = results.get(target_key(config), {"status": "not run"})
+            rows.append({"target": target.name, "server": target.server, "database": config["database"], **result})
+    return rows
+
+
+def run_results(runs: List[DatabaseRun]) -> Dict[str, Dict]:
+    '''Outcomes of DatabaseScheduler runs, keyed by "server/database".'''
+    results = {}
+    for run in runs:
+        status = "skipped" if run.skipped else "failed" if run.error else "ok"
+        results[f"{run.server}/{run.database}"] = {
+            "status": status,
+            "seconds": round(run.run_seconds, 3),
+            "error": str(run.error) if run.error else None,
+        }
+    return results
+
+
+def write_result_matrix(rows: List[Dict], log_dir: Path, logger: Optional[logging.Logger]=None) -> Path:
+    '''Log the matrix as a table grouped by target and write it to target_results.json.'''
+    logger = logger or module_logger
+    width = max([len(f"{row['target']} ({row['server']})") for row in rows] + [6])
+    logger.info("Results per target:")
+    for row in rows:
+        label = f"{row['target']} ({row['server']})"
+        seconds = f"{row['seconds']:8.1f}s" if row.get("seconds") is not None else " " * 9
+        error = f"  {row['error']}" if row.get("error") else ""
+        logger.info(f"  {label:<{width}}  {row['database']:<40} {row['status']:<8} {seconds}{error}")
+
+    statuses = [row["status"] for row in rows]
+    logger.info(
+        f"{statuses.count('ok')} of {len(rows)} database(s) on {len({row['server'] for row in rows})} server(s) succeeded"
+        f", {statuses.count('failed')} failed, {len(rows) - statuses.count('ok') - statuses.count('failed')} not run."
+    )
+
+    log_dir.mkdir(parents=True, exist_ok=True)
+    matrix_path = log_dir / "target_results.json"
+    with open(matrix_path, 'w') as f:
+        json.dump(rows, f, indent=2)
+    return matrix_path
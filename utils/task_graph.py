@@ -0,0 +1,185 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .run_journal import RunJournal
+from .tracing import Span, tracer
+
+# Module-level fallback logger
+module_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Task:
+    name: str
+    fn: Callable[[], Any]
+    depends_on: List[str] = field(default_factory=list)
+    fingerprint: Optional[Callable[[], Optional[str]]] = None # Inputs and outputs, to resume from a journal
+    status: str = "pending" # pending, running, succeeded, skipped, failed or cancelled
+    start: Optional[float] = None # Epoch seconds
+    end: Optional[float] = None
+    error: Optional[BaseException] = None
+    span: Optional[Span] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end - self.start) if self.start is not None and self.end is not None else 0.0
+
+
+class TaskGraph:
+    '''
+    Runs named tasks on a thread pool as soon as the tasks they depend on have succeeded.
+
+    After the first failure no new task is started: the tasks still waiting are marked
+    cancelled, and the running ones are waited for. Every
+    task runs in its own "task:<name>" span. Once the graph is done, the critical path
+    (the chain of tasks that decided the total time) is logged and flagged on their spans.
+
+    With a journal, every task's outcome and fingerprint are recorded. A task is skipped if
+    the journal says it succeeded with the same fingerprint and all its dependencies were
+    skipped as well, so whatever follows a task that reruns is rerun too.
+    '''
+    def __init__(self, max_workers: int=4, logger: Optional[logging.Logger]=None, journal: Optional[RunJournal]=None):
+        self.max_workers = max(1, max_workers)
+        self.logger = logger or module_logger
+        self.journal = journal
+        self.tasks: Dict[str, Task] = {}
+        self.cancelled = threading.Event()
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[[], Any],
+        depends_on: Optional[List[str]]=None,
+        fingerprint: Optional[Callable[[], Optional[str]]]=None
+    ) -> Task:
+        if name in self.tasks:
+            raise ValueError(f"Duplicate task: {name}")
+        task = Task(name, fn, list(depends_on or []), fingerprint)
+        self.tasks[name] = task
+        return task
+
+    def validate(self):
+        for task in self.tasks.values():
+            unknown = [dep for dep in task.depends_on if dep not in self.tasks]
+            if unknown:
+                raise ValueError(f"Task {task.name} depends on unknown task(s) {unknown}")
+
+    def fingerprint(self, task: Task) -> Optional[str]:
+        return task.fingerprint() if task.fingerprint else None
+
+    def previous_attempt(self, task: Task, status: str) -> bool:
+        '''Whether the journal holds an attempt of the task with this outcome, made with the same inputs as now.'''
+        if not self.journal or not all(self.tasks[dep].status == "skipped" for dep in task.depends_on):
+            return False
+        return self.journal.attempted(task.name, status, self.fingerprint(task))
+
+    def resuming(self, name: str) -> bool:
+        '''Whether the task failed before with the same inputs, so it may pick up where it stopped.'''
+        return self.previous_attempt(self.tasks[name], "failed")
+
+    def run_task(self, task: Task) -> bool:
+        '''Run the task, or skip it if the journal allows. Returns True if it was skipped.'''
+        task.start = time.time()
+        try:
+            with tracer.span(f"task:{task.name}", depends_on=task.depends_on) as span:
+                task.span = span
+                if self.previous_attempt(task, "succeeded"):
+                    self.logger.info(f"Skipping {task.name}: it succeeded before and its inputs are unchanged.")
+                    span.set(skipped=True)
+                    return True
+                try:
+                    task.fn()
+                except BaseException:
+                    if self.journal:
+                        self.journal.record_task(task.name, "failed", self.fingerprint(task))
+                    raise
+                if self.journal:
+                    self.journal.record_task(task.name, "succeeded", self.fingerprint(task))
+                return False
+        finally:
+            task.end = time.time()
+
+    def run(self):
+        '''Run every task, raising the first error once the running tasks have finished.'''
+        self.validate()
+        pending = dict(self.tasks)
+        running: Dict[Future, Task] = {}
+        errors: List[BaseException] = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="Task") as executor:
+            while pending or running:
+                if not self.cancelled.is_set():
+                    ready = [
+                        task for task in pending.values()
+                        if all(self.tasks[dep].status in ("succeeded", "skipped") for dep in task.depends_on)
+                    ]
+                    for task in ready:
+                        del pending[task.name]
+                        task.status = "running"
+                        self.logger.debug(f"Starting {task.name}.")
+                        running[executor.submit(tracer.wrap(self.run_task), task)] = task
+
+                if not running:
+                    if pending and not self.cancelled.is_set():
+                        raise ValueError(f"Circular task dependencies between {list(pending)}")
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    try:
+                        task.status = "skipped" if future.result() else "succeeded"
+                    except BaseException as e: # sys.exit() in a task must fail the graph too
+                        task.status = "failed"
+                        task.error = e
+                        errors.append(e)
+                        if not self.cancelled.is_set():
+                            self.logger.error(f"{task.name} failed, cancelling the tasks not started yet: {e!r}")
+                        self.cancelled.set()
+
+        for task in pending.values():
+            task.status = "cancelled"
+        self.log_summary()
+        if errors:
+            raise errors[0]
+
+    def critical_path(self) -> List[Task]:
+        '''
+        Walk back from the task that finished last, each time to the dependency that
+        finished last, i.e. the one the task was waiting for.
+        '''
+        finished = [task for task in self.tasks.values() if task.end is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda task: task.end)] # type: ignore
+        while True:
+            dependencies = [self.tasks[dep] for dep in path[-1].depends_on if self.tasks[dep].end is not None]
+            if not dependencies:
+                break
+            path.append(max(dependencies, key=lambda task: task.end)) # type: ignore
+        return list(reversed(path))
+
+    def log_summary(self):
+        started = [task.start for task in self.tasks.values() if task.start is not None]
+        if not started:
+            return
+        origin = min(started)
+        critical = self.critical_path()
+        critical_names = {task.name for task in critical}
+
+        self.logger.info("Task summary (start offset, duration, status):")
+        for task in sorted(self.tasks.values(), key=lambda task: (task.start is None, task.start or 0)):
+            offset = f"+{task.start - origin:7.1f}s" if task.start is not None else " " * 9
+            marker = " *" if task.name in critical_names else ""
+            self.logger.info(f"  {offset} {task.duration:8.1f}s  {task.status:<9} {task.name}{marker}")
+
+        if critical:
+            for task in critical:
+                if task.span:
+                    task.span.set(critical_path=True)
+            chain = " -> ".join(f"{task.name} ({task.duration:.1f}s)" for task in critical)
+            self.logger.info(f"Critical path (*): {chain}, {critical[-1].end - origin:.1f}s in total.") # type: ignore
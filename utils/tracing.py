@@ -0,0 +1,143 @@
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass, field
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+@dataclass
+class Span:
+    name: str
+    start: float # Epoch seconds
+    end: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    children: List["Span"] = field(default_factory=list)
+    thread: str = ""
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+    def set(self, **attributes):
+        '''Attach attributes such as bytes or row counts to the span.'''
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict:
+        span = {
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration_seconds": None if self.duration is None else round(self.duration, 6),
+            "thread": self.thread,
+        }
+        if self.attributes:
+            span["attributes"] = self.attributes
+        if self.error:
+            span["error"] = self.error
+        if self.children:
+            span["children"] = [child.to_dict() for child in self.children]
+        return span
+
+
+class Tracer:
+    '''
+    Collects nested timing spans of a run.
+
+    The current span is kept in a context variable, so spans opened inside asyncio
+    tasks and asyncio.to_thread nest correctly. Work submitted to thread pools
+    should be wrapped with wrap() to keep the submitting span as its parent.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.roots: List[Span] = []
+        self.current: ContextVar[Optional[Span]] = ContextVar(f"current_span_{id(self)}", default=None)
+
+    def add(self, span: Span, parent: Optional[Span]):
+        with self.lock:
+            (parent.children if parent else self.roots).append(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        parent = self.current.get()
+        span = Span(name, time.time(), attributes=attributes, thread=threading.current_thread().name)
+        self.add(span, parent)
+        token = self.current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.time()
+            self.current.reset(token)
+
+    def record(self, name: str, start: float, end: float, **attributes) -> Span:
+        '''Add an already finished span under the current span. Times are epoch seconds.'''
+        span = Span(name, start, end, attributes=attributes, thread=threading.current_thread().name)
+        self.add(span, self.current.get())
+        return span
+
+    def wrap(self, fn: Callable) -> Callable:
+        '''Bind fn to the current context so it runs under the current span in another thread.'''
+        context = copy_context()
+        return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+    def reset(self):
+        with self.lock:
+            self.roots = []
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            return {"spans": [span.to_dict() for span in self.roots]}
+
+    def chrome_trace(self) -> Dict:
+        '''Complete ("X") events for chrome://tracing or Perfetto.'''
+        thread_ids: Dict[str, int] = {}
+        events = []
+
+        def visit(span: Span):
+            tid = thread_ids.setdefault(span.thread, len(thread_ids) + 1)
+            end = span.end if span.end is not None else time.time()
+            args = dict(span.attributes)
+            if span.error:
+                args["error"] = span.error
+            events.append({
+                "name": span.name,
+                "ph": "X",
+                "ts": int(span.start * 1_000_000),
+                "dur": int((end - span.start) * 1_000_000),
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": args,
+            })
+            for child in span.children:
+                visit(child)
+
+        with self.lock:
+            for span in self.roots:
+                visit(span)
+        events.extend(
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": thread}}
+            for thread, tid in thread_ids.items()
+        )
+        return {"traceEvents": events}
+
+    def write_report(self, report_dir: Path, chrome_trace: bool=False) -> Path:
+        '''Write run_report.json (and run_trace.json for chrome://tracing) into report_dir.'''
+        report_dir.mkdir(parents=True, exist_ok=True)
+        report_path = report_dir / "run_report.json"
+        with open(report_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        if chrome_trace:
+            with open(report_dir / "run_trace.json", 'w') as f:
+                json.dump(self.chrome_trace(), f)
+        return report_path
+
+
+# Process-wide tracer shared by the pipeline, builder and deploy script
+tracer = Tracer()
@@ -1,27 +1,290 @@
+'''
+Previews a SQL script for approval, started by the pipeline's console approval gate.
+
+The script is memory-mapped and summarised instead of printed: size, line count, table
+blocks and risky statements (DROP, ALTER COLUMN, TRUNCATE, ...). The Y/N prompt is
+available at once, while the summary is computed in the background. Table blocks can be
+paged through and the script searched before answering. The answer is sent to the
+waiting pipeline on 127.0.0.1:<port>, prefixed with its token.
+
+Usage: python validation_console.py <port> <script> <token>
+'''
+from bisect import bisect_right
+import mmap
+import os
+import re
+import shutil
 import socket
 import sys
+import threading
 from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.script_index import CHUNK_SIZE, TableBlock, TableBlockIndexer
+
+# Statements that can lose data or break dependants, by label. Matched on lowercased text
+# wherever one of RISKY_KEYWORDS is found, which is much faster than a case-insensitive search.
+RISKY_STATEMENTS = {
+    "DROP TABLE": rb"\bdrop\s+table\b",
+    "DROP COLUMN": rb"\bdrop\s+column\b",
+    "DROP": rb"\bdrop\s+(?:index|constraint|view|proc|procedure|function|trigger|schema)\b",
+    "ALTER COLUMN": rb"\balter\s+column\b",
+    "TRUNCATE": rb"\btruncate\s+table\b",
+    "DELETE": rb"\bdelete\s+(?:from\s+)?[\[#@\w]",
+    "RENAME": rb"\bsp_rename\b",
+}
+RISKY_PATTERN = re.compile(b"|".join(b"(?P<risky%d>%s)" % (i, pattern) for i, pattern in enumerate(RISKY_STATEMENTS.values())))
+RISKY_LABELS = {f"risky{i}": label for i, label in enumerate(RISKY_STATEMENTS)}
+RISKY_KEYWORDS = (b"drop", b"alter", b"truncate", b"delete", b"sp_rename")
+RISKY_OVERLAP = 256 # Bytes past a chunk a statement found near its end may need
+
+SUMMARY_WAIT_SECONDS = 2 # Show the summary before the prompt if it is ready by then
+EXAMPLES_PER_KIND = 5
+HELP = '''Commands:
+  y / n          approve or reject the script
+  s              summary
+  t [text]       list the table blocks, optionally only those containing text
+  v <table>      page through a table block
+  r              page through every risky statement
+  /<text>        search the script (case-insensitive)
+  h              this help'''
+
+
+class ScriptPreview:
+    def __init__(self, script_path: Path):
+        self.script_path = script_path
+        self.file = open(script_path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self.blocks: List[TableBlock] = []
+        self.block_offsets: List[int] = []
+        self.line_count = 0
+        self.risky: List[Tuple[int, str]] = [] # (offset, label) in script order
+        self.error: Optional[Exception] = None
+        self.ready = threading.Event()
+
+    def analyse(self):
+        '''Index the table blocks, count the lines and find the risky statements.'''
+        try:
+            indexer = TableBlockIndexer()
+            newlines = 0
+            for start in range(0, self.size, CHUNK_SIZE):
+                chunk = self.data[start:start + CHUNK_SIZE]
+                indexer.feed(chunk)
+                newlines += chunk.count(b"\n")
+            indexer.close()
+
+            self.blocks = sorted(indexer.blocks.values(), key=lambda block: block.offset)
+            self.block_offsets = [block.offset for block in self.blocks]
+            self.line_count = newlines + (1 if self.size and self.data[-1:] != b"\n" else 0)
+            self.risky = sorted(
+                (chunk_offset + position, RISKY_LABELS[match.lastgroup]) # type: ignore
+                for keyword in RISKY_KEYWORDS
+                for chunk, position, chunk_offset in self.scan(keyword, RISKY_OVERLAP)
+                if (match := RISKY_PATTERN.match(chunk, position))
+            )
+        except Exception as e:
+            self.error = e
+        finally:
+            self.ready.set()
+
+    def scan(self, needle: bytes, overlap: int) -> Iterator[Tuple[bytes, int, int]]:
+        '''
+        Case-insensitive search. Yields the lowercased chunk, the position in the chunk and
+        the chunk's offset of every occurrence, in script order.
+        '''
+        needle = needle.lower()
+        overlap = max(overlap, len(needle) - 1)
+        for start in range(0, self.size, CHUNK_SIZE):
+            chunk = self.data[start:start + CHUNK_SIZE + overlap].lower()
+            position = chunk.find(needle)
+            while position != -1 and position < CHUNK_SIZE:
+                yield chunk, position, start
+                position = chunk.find(needle, position + 1)
+
+    def table_at(self, offset: int) -> Optional[str]:
+        i = bisect_right(self.block_offsets, offset) - 1
+        if i >= 0 and offset < self.blocks[i].offset + self.blocks[i].length:
+            return self.blocks[i].table
+        return None
+
+    def line_text(self, offset: int, width: int) -> str:
+        start = self.data.rfind(b"\n", 0, offset) + 1
+        end = self.data.find(b"\n", offset)
+        line = self.data[start:end if end != -1 else self.size].decode("utf-8", errors="replace").strip()
+        return line if len(line) <= width else line[:width - 3] + "..."
+
+    def with_line_numbers(self, offsets: Iterable[int]) -> Iterator[Tuple[int, int]]:
+        '''Pairs sorted byte offsets with their line numbers, counting newlines only once.'''
+        line, position = 1, 0
+        for offset in offsets:
+            line += self.data[position:offset].count(b"\n")
+            position = offset
+            yield offset, line
+
+    def block_lines(self, block: TableBlock) -> Iterator[str]:
+        position, end = block.offset, block.offset + block.length
+        while position < end:
+            line_end = self.data.find(b"\n", position, end)
+            line_end = end if line_end == -1 else line_end + 1
+            yield self.data[position:line_end].decode("utf-8", errors="replace").rstrip("\r\n")
+            position = line_end
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+
+class Console:
+    def __init__(self, preview: ScriptPreview):
+        self.preview = preview
+        size = shutil.get_terminal_size()
+        self.width = size.columns - 1
+        self.page_lines = max(10, size.lines - 3)
+
+    def wait_for_analysis(self) -> bool:
+        if not self.preview.ready.is_set():
+            print("Still indexing the script...")
+            self.preview.ready.wait()
+        if self.preview.error:
+            print(f"The script could not be analysed: {self.preview.error}")
+            return False
+        return True
+
+    def page(self, lines: Iterable[str]):
+        shown = 0
+        for line in lines:
+            print(line)
+            shown += 1
+            if shown % self.page_lines == 0:
+                if input("-- Enter: next page, q: stop -- ").strip().lower() == "q":
+                    return
+
+    def summary(self):
+        preview = self.preview
+        print(f"Script: {preview.script_path}")
+        print(f"Size: {preview.size / 1024 / 1024:.1f} MB, {preview.line_count:,} lines, {len(preview.blocks)} table block(s)")
+        if preview.blocks:
+            tables = ", ".join(block.table for block in preview.blocks[:30])
+            print(f"Tables: {tables}" + (f", ... ({len(preview.blocks) - 30} more, t lists them all)" if len(preview.blocks) > 30 else ""))
+
+        if not preview.risky:
+            print("Risky statements: none")
+            return
+        counts = {}
+        for _, label in preview.risky:
+            counts[label] = counts.get(label, 0) + 1
+        print("Risky statements: " + ", ".join(f"{count} {label}" for label, count in counts.items()))
+        examples = {}
+        for offset, label in preview.risky:
+            if len(examples.setdefault(label, [])) < EXAMPLES_PER_KIND:
+                examples[label].append(offset)
+        offsets = sorted(offset for label_offsets in examples.values() for offset in label_offsets)
+        for offset, line in preview.with_line_numbers(offsets):
+            print(self.describe(offset, line))
+        if len(offsets) < len(preview.risky):
+            print("  (r lists them all)")
+
+    def describe(self, offset: int, line: int) -> str:
+        table = self.preview.table_at(offset) or "-"
+        prefix = f"  {line:>9}  [{table}] "
+        return prefix + self.preview.line_text(offset, self.width - len(prefix))
+
+    def tables(self, text: str):
+        preview = self.preview
+        risky_tables = {preview.table_at(offset) for offset, _ in preview.risky}
+
+        def rows():
+            for block in preview.blocks:
+                if text.lower() in block.table.lower():
+                    lines = preview.data[block.offset:block.offset + block.length].count(b"\n")
+                    marker = "  risky" if block.table in risky_tables else ""
+                    yield f"  {block.table:<50} {lines:>9,} lines {block.length / 1024:>10.1f} KB{marker}"
+        self.page(rows())
+
+    def view(self, table: str):
+        block = next((block for block in self.preview.blocks if block.table.lower() == table.lower()), None)
+        if block is None:
+            print(f"No table block named {table}. Use t to list them.")
+            return
+        self.page(self.preview.block_lines(block))
+
+    def risky(self):
+        preview = self.preview
+        self.page(self.describe(offset, line) for offset, line in preview.with_line_numbers(offset for offset, _ in preview.risky))
+
+    def search(self, text: str):
+        def hits():
+            last_line = 0
+            offsets = (chunk_offset + position for _, position, chunk_offset in self.preview.scan(text.encode(), 0))
+            found = False
+            for offset, line in self.preview.with_line_numbers(offsets):
+                found = True
+                if line != last_line:
+                    last_line = line
+                    yield self.describe(offset, line)
+            if not found:
+                yield f"No match for {text!r}."
+        self.page(hits())
+
+    def ask(self) -> str:
+        '''Runs commands until the script is approved or rejected, and returns "Y" or "N".'''
+        while True:
+            command = input("\nProceed with executing the script (Y/N), or h for help: ").strip()
+            answer = command.upper()
+            if answer in ("Y", "YES", "N", "NO"):
+                return answer[0]
+            if command in ("h", "?", ""):
+                print(HELP)
+            elif self.wait_for_analysis():
+                name, _, argument = command.partition(" ")
+                if command.startswith("/") and len(command) > 1:
+                    self.search(command[1:])
+                elif name == "s":
+                    self.summary()
+                elif name == "t":
+                    self.tables(argument.strip())
+                elif name == "v" and argument.strip():
+                    self.view(argument.strip())
+                elif name == "r":
+                    self.risky()
+                else:
+                    print(HELP)
+
+
+def main():
+    if len(sys.argv) != 4:
+        print("Usage: python validation_console.py <port> <script> <token>")
+        sys.exit(1)
+
+    port = int(sys.argv[1])
+    script_path = Path(sys.argv[2])
+    token = sys.argv[3] # Proves to the waiting pipeline that the answer comes from this console
 
-if len(sys.argv) != 3:
-    print("Usage: python validation_console.py <port> <script>")
-    sys.exit(1)
+    preview = ScriptPreview(script_path)
+    threading.Thread(target=preview.analyse, daemon=True).start()
+    console = Console(preview)
 
-port = int(sys.argv[1])
-script_path = Path(sys.argv[2])
+    print(f"Script path: {script_path} ({preview.size / 1024 / 1024:.1f} MB)\n")
+    if preview.ready.wait(SUMMARY_WAIT_SECONDS) and not preview.error:
+        console.summary()
+    else:
+        print("Indexing the script in the background. Type s for the summary once it is done, or answer now.")
 
-# Print script to console for preview
-print(f"Script path: {script_path}\n")
-with script_path.open("r", encoding="utf-8") as f:
-    for line in f:
-        # Write directly to stdout immediately
-        sys.stdout.write(line)
+    try:
+        resp = console.ask()
+    except (EOFError, KeyboardInterrupt):
+        sys.exit(1) # Closed without an answer, which the pipeline treats as a rejection
 
-        # Ensures it appears in console immediately
-        sys.stdout.flush()  
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.connect(("127.0.0.1", port))
+    s.send(f"{token} {resp}".encode())
+    s.close()
+    preview.close()
 
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-s.connect(("127.0.0.1", port))
 
-resp = input("\nProceed with executing the script (Y/N): ")
-s.send(resp.encode())
-s.close()
\ No newline at end of file
+if __name__ == "__main__":
+    main()